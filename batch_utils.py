@@ -0,0 +1,86 @@
+"""
+Corey Zarkowski, Bryan Phan, Lawrence Lorbiecki -- CSE 163
+Reading & writing files of prospects for batch predictions, used in
+'player_predictor.py'. Inputs and outputs are csv or JSON-lines files,
+picked by file extension.
+"""
+
+import csv
+import json
+import sys
+
+RESULT_FIELDS = ['query', 'name', 'Points', 'Assists', 'Rebounds', 'FGP',
+                 'projected_career_length', 'projected_prime', 'allstar',
+                 'allstar_probability', 'comparables', 'error']
+
+
+def is_csv(path):
+    """
+    Returns whether a file path should be read/written as csv (rather than
+    JSON lines).
+    """
+    return path.lower().endswith('.csv')
+
+
+def read_prospects(path):
+    """
+    Takes the path of a csv or JSON-lines file of prospects, and returns a
+    list of dicts, one per prospect. Each has a 'name', college stats, or
+    both. A plain text file of names (one per line) also works.
+    """
+    prospects = []
+
+    with open(path, 'r', newline='') as infile:
+        if is_csv(path):
+            return [dict(row) for row in csv.DictReader(infile)]
+
+        for line in infile:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('{'):
+                prospects.append(json.loads(line))
+            else:
+                prospects.append({'name': line})
+
+    return prospects
+
+
+def write_results(path, results, stdout=None):
+    """
+    Takes an output path ('-' for stdout, or the given stdout stream) and
+    an iterable of prediction dicts, and writes each one as soon as it's
+    produced, as a csv row or a JSON line (in csv, comparables are listed
+    by name, separated by '; '). Returns the number of results written.
+    """
+    stdout = stdout or sys.stdout
+    outfile = stdout if path == '-' else open(path, 'w', newline='')
+    count = 0
+
+    try:
+        if is_csv(path):
+            writer = csv.DictWriter(outfile, fieldnames=RESULT_FIELDS,
+                                    extrasaction='ignore')
+            writer.writeheader()
+
+            def write(result):
+                if 'comparables' in result:
+                    result = dict(result, comparables='; '.join(
+                        comp['name'] for comp in result['comparables']))
+                writer.writerow(result)
+        else:
+            def write(result):
+                outfile.write(json.dumps(result) + '\n')
+
+        for result in results:
+            write(result)
+            count += 1
+            if count % 100 == 0:
+                outfile.flush()
+    finally:
+        if outfile is stdout:
+            outfile.flush()
+        else:
+            outfile.close()
+
+    return count
@@ -0,0 +1,426 @@
+"""
+Corey Zarkowski, Bryan Phan, Lawrence Lorbiecki -- CSE 163
+Offline benchmarks for the scraping, training and prediction hot paths.
+Nothing here touches the network: the page parsers run on HTML fixtures,
+and everything else runs on the files in 'data'. Results are written as
+JSON, and can be compared against an earlier run to catch regressions:
+
+    python benchmark.py --output before.json
+    python benchmark.py --output after.json --compare before.json
+
+By default the fixtures are generated from 'player_data.csv' in the markup
+the parsers expect (college player pages, and nba season totals pages for
+1950-2021). Recorded pages can be used instead with --fixtures DIR, where
+DIR has 'cbb/*.html' and 'nba/*.html'.
+"""
+
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import sklearn
+from comparables import build_comparables, find_comparables
+from forest_model import export_forest, load_forest
+from manual_utils import COLLEGE_STAT_FIELDS, format_career_data,\
+                         parse_college_player_page, parse_season_page
+from name_index import build_name_index
+from name_store import open_name_store
+from player_predictor import FEATURES, find_similar_player,\
+                             load_player_data, load_player_name_index,\
+                             predict_batch, predict_players,\
+                             train_model_allstar, train_model_careerstats,\
+                             training_arrays
+
+# forest sizes model training is timed at
+TRAIN_ESTIMATORS = [10, 50, 100, 200]
+# thread counts model training is timed at (-1 for one per core)
+TRAIN_JOBS = [1, -1]
+# prospects per batch prediction, and misspelled names looked up
+BATCH_PROSPECTS = 1000
+NAME_QUERIES = 200
+# seasons the generated nba fixtures cover
+FIXTURE_YEARS = range(1950, 2022)
+# columns of a season totals row, in page order
+SEASON_COLUMNS = ['pos', 'age', 'team_id', 'g', 'gs', 'mp', 'fg', 'fga',
+                  'fg_pct', 'fg3', 'fg3a', 'fg3_pct', 'fg2', 'fg2a',
+                  'fg2_pct', 'efg_pct', 'ft', 'fta', 'ft_pct', 'orb', 'drb',
+                  'trb', 'ast', 'stl', 'blk', 'tov', 'pf', 'pts']
+# generic markup that pads fixture pages out to a realistic size
+FILLER_LINE = b'<div class="filler"><a href="/about/">About</a>' \
+              b'<span data-tip="nav">Navigation</span></div>'
+
+
+def college_page(player, rng):
+    """
+    Takes a row of player data and returns a fixture college player page
+    (bytes) with their career stats in the pullout near the top, followed
+    by a season table the parser should skip.
+    """
+    lines = [b'<!DOCTYPE html>', b'<html><head><title>' +
+             player['name'].encode() + b' College Stats</title></head>']
+    lines += [FILLER_LINE] * 300
+    lines.append(b'<div class="stats_pullout"><div class="p1">')
+    for header, field in COLLEGE_STAT_FIELDS.items():
+        if pd.isna(player.get(field)):
+            continue
+        lines.append(b'<div><span class="poptip" data-tip="' +
+                     field.encode() + b'"><strong>' + header +
+                     b'</strong></span>')
+        lines.append(b'<p>' + str(round(float(player[field]), 1)).encode() +
+                     b'</p></div>')
+    lines.append(b'</div></div>')
+
+    for season in range(int(rng.integers(1, 5))):
+        lines.append(b'<tr><th data-stat="season">' + str(season).encode() +
+                     b'</th>' + b''.join(
+                         b'<td data-stat="stat" >' +
+                         str(rng.integers(0, 500)).encode() + b'</td>'
+                         for i in range(25)) + b'</tr>')
+    lines += [FILLER_LINE] * 1200
+    lines.append(b'</html>')
+
+    return b'\n'.join(lines)
+
+
+def season_row(rank, name, year, rng, partial=False):
+    """
+    Returns a player row (bytes) of a fixture season totals page, with
+    random stats. Steals & blocks are blank before 1974, like on the site.
+    """
+    first, _, last = name.partition(' ')
+    cells = [b'<tr class="' +
+             (b'italic_text partial_table' if partial else b'full_table') +
+             b'" ><th scope="row" class="right " data-stat="ranker" csk="' +
+             str(rank).encode() + b'" >' + str(rank).encode() + b'</th>',
+             b'<td class="left " data-stat="player" csk="' +
+             (last + ',' + first).encode() + b'" ><a href="/players/' +
+             name[-1:].lower().encode() + b'/' +
+             name.replace(' ', '')[:7].lower().encode() + b'01.html">' +
+             name.encode() + b'</a></td>']
+
+    for column in SEASON_COLUMNS:
+        if column in ('stl', 'blk') and year < 1974:
+            value = b''
+        elif column == 'pos':
+            value = b'SF'
+        elif column == 'team_id':
+            value = b'<a href="/teams/LAL/' + str(year).encode() + \
+                    b'.html">LAL</a>'
+        elif column.endswith('_pct'):
+            value = ('.' + str(rng.integers(100, 700))).encode()
+        else:
+            value = str(rng.integers(0, 2000)).encode()
+        cells.append(b'<td class="right " data-stat="' + column.encode() +
+                     b'" >' + value + b'</td>')
+
+    return b''.join(cells) + b'</tr>'
+
+
+def season_pages(names, rng):
+    """
+    Takes a list of player names and returns a list of fixture season
+    totals pages (bytes), one per year in FIXTURE_YEARS. Every player
+    gets a career of random length, and some are traded mid-season (a
+    total row plus partial rows per team).
+    """
+    starts = rng.integers(FIXTURE_YEARS[0], FIXTURE_YEARS[-1], len(names))
+    lengths = rng.integers(1, 16, len(names))
+    pages = []
+
+    for year in FIXTURE_YEARS:
+        lines = [b'<!DOCTYPE html>', b'<html><head><title>' +
+                 str(year).encode() + b' NBA Player Totals</title></head>']
+        lines += [FILLER_LINE] * 300
+        active = np.flatnonzero((starts <= year) &
+                                (year < starts + lengths))
+        for rank, i in enumerate(active, 1):
+            lines.append(season_row(rank, names[i], year, rng))
+            if rng.random() < 0.05:
+                lines.append(season_row(rank, names[i], year, rng, True))
+                lines.append(season_row(rank, names[i], year, rng, True))
+        lines += [FILLER_LINE] * 100
+        lines.append(b'</html>')
+        pages.append(b'\n'.join(lines))
+
+    return pages
+
+
+def load_fixtures(fixture_dir, players_df, rng):
+    """
+    Returns a tuple of college player pages and nba season totals pages
+    (lists of bytes), read from fixture_dir, or generated if it's None.
+    """
+    if fixture_dir is not None:
+        def read_pages(pattern):
+            pages = []
+            for path in sorted(glob.glob(os.path.join(fixture_dir,
+                                                      pattern))):
+                with open(path, 'rb') as infile:
+                    pages.append(infile.read())
+            return pages
+
+        return read_pages(os.path.join('cbb', '*.html')),\
+            read_pages(os.path.join('nba', '*.html'))
+
+    players = players_df.astype({'name': str}).to_dict('records')
+    names = [player['name'] for player in players
+             if '\\' not in player['name']]
+    names += ['Fixture Player' + str(i) for i in range(6000)]
+
+    return [college_page(player, rng) for player in players],\
+        season_pages(names, rng)
+
+
+def misspell(name, rng):
+    """
+    Returns a name with one random typo (a dropped, doubled or swapped
+    letter), lowercased half the time.
+    """
+    i = int(rng.integers(1, max(2, len(name) - 1)))
+    typo = int(rng.integers(0, 3))
+    if typo == 0:
+        name = name[:i] + name[i + 1:]
+    elif typo == 1:
+        name = name[:i] + name[i] + name[i:]
+    else:
+        name = name[:i - 1] + name[i] + name[i - 1] + name[i + 1:]
+    return name.lower() if rng.random() < 0.5 else name
+
+
+def time_case(results, name, func, items=1, repeat=5, **params):
+    """
+    Runs func repeat times (with anything it prints discarded), and adds a
+    result dict to results with the wall time of every run, the median &
+    fastest run, and the median time per item. Returns func's last result.
+    """
+    seconds = []
+    for run in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            value = func()
+            seconds.append(time.perf_counter() - start)
+
+    median = statistics.median(seconds)
+    results.append({'name': name, 'params': params, 'items': items,
+                    'repeat': repeat, 'seconds': seconds,
+                    'median': median, 'min': min(seconds),
+                    'per_item': median / items})
+    print('{:<36}{:>10.4f}s{:>12.2e}s/item'.format(name, median,
+                                                   median / items))
+    return value
+
+
+def run_benchmarks(fixture_dir=None, repeat=5, only=None):
+    """
+    Runs every benchmark (or those whose names contain one of the strings
+    in only) and returns a list of result dicts (see time_case).
+    """
+    results = []
+    rng = np.random.default_rng(163)
+
+    def wanted(name):
+        return not only or any(part in name for part in only)
+
+    players_df = load_player_data()
+    college_pages, nba_pages = load_fixtures(fixture_dir, players_df, rng)
+
+    if wanted('parse_college_player_page'):
+        time_case(results, 'parse_college_player_page',
+                  lambda: [parse_college_player_page(page)
+                           for page in college_pages],
+                  len(college_pages), repeat, pages=len(college_pages))
+
+    season_table = None
+    if wanted('parse_season_page') or wanted('format_career_data'):
+        rows = time_case(results, 'parse_season_page',
+                         lambda: [parse_season_page(page)
+                                  for page in nba_pages],
+                         len(nba_pages), repeat, pages=len(nba_pages))
+        season_table = pd.DataFrame([
+            {'name': name, 'year': year, **stats}
+            for year, page_rows in zip(FIXTURE_YEARS, rows)
+            for name, stats in page_rows
+        ]).astype({'name': 'category', 'year': np.int16})
+        season_table = season_table.set_index(['name', 'year'])\
+            .astype(np.float32).sort_index()
+
+    if wanted('format_career_data') and len(season_table):
+        time_case(results, 'format_career_data',
+                  lambda: format_career_data(season_table),
+                  len(season_table), repeat, seasons=len(season_table))
+
+    if wanted('name'):
+        cbb_players = open_name_store(os.path.join(os.getcwd(), 'data',
+                                                   'college_players.db'))
+        names = list(cbb_players)
+        time_case(results, 'build_name_index',
+                  lambda: build_name_index(names), len(names),
+                  max(1, repeat // 5), names=len(names))
+        name_index = load_player_name_index(cbb_players)
+        queries = [misspell(names[i], rng) for i in
+                   rng.choice(len(names), NAME_QUERIES, replace=False)]
+        time_case(results, 'find_similar_player',
+                  lambda: [find_similar_player(query, name_index, 5)
+                           for query in queries],
+                  len(queries), repeat, names=len(names),
+                  queries=len(queries))
+        cbb_players.close()
+
+    arrays = training_arrays(players_df)
+    if wanted('training_arrays'):
+        time_case(results, 'training_arrays',
+                  lambda: training_arrays(players_df), len(players_df),
+                  repeat)
+
+    for estimators in TRAIN_ESTIMATORS:
+        for jobs in TRAIN_JOBS:
+            suffix = '' if jobs == 1 else '/jobs' + str(jobs)
+            if wanted('train_model_careerstats'):
+                time_case(results, 'train_model_careerstats/' +
+                          str(estimators) + suffix,
+                          lambda: train_model_careerstats(
+                              *arrays['careerstats'], estimators, None,
+                              jobs),
+                          len(players_df), max(1, repeat // 2),
+                          n_estimators=estimators, jobs=jobs)
+            if wanted('train_model_allstar'):
+                time_case(results, 'train_model_allstar/' +
+                          str(estimators) + suffix,
+                          lambda: train_model_allstar(
+                              *arrays['allstar'], estimators, None, jobs),
+                          len(players_df), max(1, repeat // 2),
+                          n_estimators=estimators, jobs=jobs)
+
+    if wanted('predict'):
+        career = train_model_careerstats(*arrays['careerstats'], 100, None)
+        allstar = train_model_allstar(*arrays['allstar'], 100, None)
+        prospects = players_df[['name'] + FEATURES].dropna()\
+            .astype({'name': str}).sample(BATCH_PROSPECTS, replace=True,
+                                          random_state=163)\
+            .to_dict('records')
+
+        time_case(results, 'predict_players/single',
+                  lambda: [predict_players([prospect], career, allstar)
+                           for prospect in prospects[:100]],
+                  100, repeat, n_estimators=100)
+        time_case(results, 'predict_batch',
+                  lambda: list(predict_batch(prospects, {}, career,
+                                             allstar)),
+                  len(prospects), repeat, prospects=len(prospects),
+                  n_estimators=100)
+
+        comparables = build_comparables(players_df)
+        comp_stats = pd.DataFrame(prospects)[comparables['features']]
+        time_case(results, 'build_comparables',
+                  lambda: build_comparables(players_df), len(players_df),
+                  repeat)
+        time_case(results, 'find_comparables',
+                  lambda: find_comparables(comparables, comp_stats),
+                  len(prospects), repeat, prospects=len(prospects))
+
+        # the same models exported, as the model cache loads them
+        with tempfile.TemporaryDirectory() as forest_dir:
+            export_forest(career, os.path.join(forest_dir, 'career'))
+            export_forest(allstar, os.path.join(forest_dir, 'allstar'))
+            career = load_forest(os.path.join(forest_dir, 'career'))
+            allstar = load_forest(os.path.join(forest_dir, 'allstar'))
+
+            time_case(results, 'predict_players/single/forest',
+                      lambda: [predict_players([prospect], career, allstar)
+                               for prospect in prospects[:100]],
+                      100, repeat, n_estimators=100)
+            time_case(results, 'predict_batch/forest',
+                      lambda: list(predict_batch(prospects, {}, career,
+                                                 allstar)),
+                      len(prospects), repeat, prospects=len(prospects),
+                      n_estimators=100)
+
+    return results
+
+
+def compare_results(results, baseline, tolerance):
+    """
+    Takes this run's results and an earlier run's, and prints how the
+    median time of every benchmark in both changed. Returns the names of
+    the benchmarks that got more than 'tolerance' (a fraction) slower.
+    """
+    old = {result['name']: result for result in baseline['results']}
+    regressions = []
+
+    for result in results:
+        if result['name'] not in old:
+            continue
+        ratio = result['median'] / old[result['name']]['median']
+        flag = ''
+        if ratio > 1 + tolerance:
+            flag = '  REGRESSION'
+            regressions.append(result['name'])
+        print('{:<36}{:>10.4f}s -> {:.4f}s ({:.2f}x){}'.format(
+            result['name'], old[result['name']]['median'], result['median'],
+            ratio, flag))
+
+    return regressions
+
+
+def main():
+    """
+    Runs the benchmarks, writes the results to the --output file, and
+    compares them to the --compare file if given. Exits with status 1 if
+    anything regressed.
+    """
+    parser = argparse.ArgumentParser(description='Time the scraping, \
+                                                 training and prediction \
+                                                 hot paths offline')
+    parser.add_argument('--output', default='benchmark.json',
+                        help='File the JSON results are written to')
+    parser.add_argument('--compare', metavar='FILE', default=None,
+                        help='Earlier results file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='How much slower (as a fraction) counts as a \
+                             regression with --compare')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Runs per benchmark (training runs half as \
+                             many)')
+    parser.add_argument('--fixtures', metavar='DIR', default=None,
+                        help='Directory of recorded pages (cbb/*.html, \
+                             nba/*.html) to parse instead of generated ones')
+    parser.add_argument('--only', nargs='*', default=None,
+                        help='Only run benchmarks whose names contain one \
+                             of these')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.fixtures, args.repeat, args.only)
+    with open(args.output, 'w') as outfile:
+        json.dump({
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'versions': {'numpy': np.__version__, 'pandas': pd.__version__,
+                         'sklearn': sklearn.__version__},
+            'fixtures': args.fixtures or 'generated',
+            'results': results
+        }, outfile, indent=2)
+    print('results written to ' + args.output)
+
+    if args.compare:
+        with open(args.compare, 'r') as infile:
+            regressions = compare_results(results, json.load(infile),
+                                          args.tolerance)
+        if regressions:
+            print(str(len(regressions)) + ' benchmarks regressed')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Corey Zarkowski, Bryan Phan, Lawrence Lorbiecki -- CSE 163
+On-disk store of parsed college stats, used by 'manual_utils.py' so a
+player's page is only fetched & parsed again once their stats may have
+changed. Records are kept in an SQLite table keyed by sports-reference
+URL, with the time they were fetched and whether the player's college
+career was over by then: those never expire, and the rest expire after a
+TTL.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+
+class CollegeStore:
+    """
+    A college stats store file. Safe to share between threads.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode = WAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS college_stats ('
+                        'url TEXT PRIMARY KEY, stats TEXT NOT NULL, '
+                        'fetched_at REAL NOT NULL, '
+                        'finished INTEGER NOT NULL) WITHOUT ROWID')
+
+    def lookup(self, urls, ttl):
+        """
+        Takes an iterable of player page URLs and a TTL in seconds. Returns
+        a dict of the URLs with fresh stats in the store (finished careers,
+        or fetched less than ttl seconds ago) to their stats dicts.
+        """
+        oldest = time.time() - ttl
+        found = {}
+        with self.lock:
+            for url in set(urls):
+                row = self.db.execute(
+                    'SELECT stats FROM college_stats WHERE url = ? AND '
+                    '(finished OR fetched_at >= ?)', (url, oldest)).fetchone()
+                if row is not None:
+                    found[url] = json.loads(row[0])
+        return found
+
+    def save(self, url, stats, finished=False):
+        """
+        Takes a player page URL, the stats parsed from it (dict), and
+        whether the player's college career is over, and stores them
+        (replacing any earlier record).
+        """
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO college_stats VALUES '
+                            '(?, ?, ?, ?)', (url, json.dumps(stats),
+                                             time.time(), int(finished)))
+            self.db.commit()
+
+    def close(self):
+        """
+        Closes the store file.
+        """
+        self.db.close()
+
+
+def open_college_store(path):
+    """
+    Takes the path of a college stats store file (created if missing) and
+    returns a CollegeStore for it.
+    """
+    return CollegeStore(path)
@@ -0,0 +1,117 @@
+"""
+Corey Zarkowski, Bryan Phan, Lawrence Lorbiecki -- CSE 163
+Comparable players, used in 'player_predictor.py'. Every nba player in the
+data with a full college profile is a point in a KD-tree over their
+standardized college stats, and a prospect's comparables are the players
+nearest to them, with how their nba careers went. The tree is built once
+and saved next to the data, and rebuilt only when the data changes.
+
+The tree is scipy's cKDTree (scipy comes with sklearn), which imports much
+faster than sklearn.neighbors, so looking up comparables doesn't undo the
+sklearn-free prediction path (see 'forest_model.py').
+"""
+
+import os
+import pickle
+import numpy as np
+import metrics
+from name_index import source_stamp
+
+# college stats players are compared on
+COMP_FEATURES = ['Points', 'Assists', 'Rebounds', 'FGP']
+# nba outcomes reported for every comparable
+COMP_OUTCOMES = ['nba_career_length', 'best_year', 'allstar']
+# comparables found per prospect
+COMP_COUNT = 5
+
+
+def build_comparables(data, features=COMP_FEATURES):
+    """
+    Takes a dataset (pandas df) of nba players with college stats, and the
+    stats to compare on. Returns a comparables index (dict) over every
+    player with all of those stats and known outcomes: the stats' means &
+    scales, the KD-tree of the standardized stats, and the players' names
+    & outcomes.
+    """
+    from scipy.spatial import cKDTree
+
+    data = data.dropna(subset=features + COMP_OUTCOMES[:2])
+    points = data[features].to_numpy(np.float64)
+    mean = points.mean(axis=0)
+    scale = points.std(axis=0)
+    scale[scale == 0] = 1.0
+
+    return {
+        'features': list(features),
+        'mean': mean,
+        'scale': scale,
+        'tree': cKDTree((points - mean) / scale),
+        'names': data['name'].astype(str).to_numpy(),
+        'outcomes': {outcome: data[outcome].to_numpy()
+                     for outcome in COMP_OUTCOMES}
+    }
+
+
+def save_comparables(index, path, source_path):
+    """
+    Takes a comparables index and pickles it to the given path, stamped
+    with the data file it was built from. The file is written next to the
+    target and moved into place at the end.
+    """
+    with open(path + '.tmp', 'wb') as outfile:
+        pickle.dump({'source': source_stamp(source_path), **index}, outfile,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + '.tmp', path)
+
+
+def load_comparables(path, source_path, data=None):
+    """
+    Loads the comparables index saved at path. If it's missing or the data
+    file at source_path changed since it was saved, the index is rebuilt
+    from data (a pandas df, or a callable returning one) and saved again.
+    Returns the comparables index.
+    """
+    if os.path.exists(path):
+        with open(path, 'rb') as infile:
+            saved = pickle.load(infile)
+        if np.array_equal(saved.pop('source'), source_stamp(source_path)):
+            metrics.count('comparables.hits')
+            return saved
+
+    metrics.count('comparables.misses')
+    print('building comparables index...')
+    index = build_comparables(data() if callable(data) else data)
+    save_comparables(index, path, source_path)
+    return index
+
+
+def find_comparables(index, stats, k=COMP_COUNT):
+    """
+    Takes a comparables index, a 2d array (or dataframe) of prospects'
+    college stats (the index's features, in order), and a count k. Returns
+    a list with a list of up to k comparable dicts per prospect, nearest
+    first: the player's 'name', their 'distance' from the prospect (in
+    standard deviations), and their nba outcomes. All prospects are looked
+    up in one query.
+    """
+    stats = np.asarray(stats, dtype=np.float64).reshape(
+        -1, len(index['features']))
+    k = min(k, index['tree'].n)
+    if not len(stats) or not k:
+        return [[] for row in stats]
+
+    distances, players = index['tree'].query(
+        (stats - index['mean']) / index['scale'], k=k)
+    distances = distances.reshape(len(stats), k)
+    players = players.reshape(len(stats), k)
+
+    outcomes = {outcome: values[players]
+                for outcome, values in index['outcomes'].items()}
+    return [[{'name': str(index['names'][player]),
+              'distance': round(float(distances[row, rank]), 3),
+              'nba_career_length': int(outcomes['nba_career_length']
+                                       [row, rank]),
+              'best_year': int(outcomes['best_year'][row, rank]),
+              'allstar': bool(outcomes['allstar'][row, rank])}
+             for rank, player in enumerate(players[row])]
+            for row in range(len(stats))]
@@ -0,0 +1,178 @@
+"""
+Corey Zarkowski, Bryan Phan, Lawrence Lorbiecki -- CSE 163
+Compact exported random forests, used by 'model_utils.py' so cached models
+can make predictions without loading (or importing) sklearn. Every tree of
+a trained forest is flattened into shared arrays: the feature and
+threshold of each node, its left & right children (a leaf is its own
+child), and its value. The arrays are saved as .npy files in a directory
+and memory-mapped when loaded, so only the nodes predictions visit are
+read.
+
+Predictions are the same as sklearn's: features are cast to float32 and
+compared to the (float64) thresholds with '<=', leaf values are normalized
+like sklearn's trees do, and the trees are added up in order before
+dividing by their count. NaN or infinite features are rejected rather
+than predicted differently.
+"""
+
+import json
+import os
+import shutil
+import numpy as np
+
+FOREST_ARRAYS = ['roots', 'feature', 'threshold', 'children', 'values']
+
+
+class ForestModel:
+    """
+    A memory-mapped exported forest, with the prediction methods of the
+    sklearn forest it came from: predict for regressors, and predict &
+    predict_proba (and classes_) for classifiers.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        for name in FOREST_ARRAYS:
+            # plain array views of the maps index faster than np.memmap
+            setattr(self, name, np.asarray(np.load(
+                os.path.join(path, name + '.npy'), mmap_mode='r')))
+        with open(os.path.join(path, 'forest.json'), 'r') as infile:
+            info = json.load(infile)
+        self.depth = info['depth']
+        self.n_features_in_ = info['n_features']
+        self.n_outputs_ = info['n_outputs']
+
+        self.classes_ = None
+        if os.path.exists(os.path.join(path, 'classes.npy')):
+            self.classes_ = np.load(os.path.join(path, 'classes.npy'))
+
+    def apply(self, X):
+        """
+        Takes a 2d array (or dataframe) of features and returns the index
+        of the leaf every row lands in for every tree, as a (rows, trees)
+        array. Raises ValueError for NaN or infinite features.
+        """
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError('expected ' + str(self.n_features_in_) +
+                             ' features, got ' + str(X.shape[-1]))
+        if not np.isfinite(X).all():
+            # sklearn rejects infinity too, and newer versions send NaN down
+            # each node's missing value branch, which isn't exported (here
+            # it would just go right at every split)
+            raise ValueError('features contain NaN or infinity')
+
+        # every (row, tree) pair walks down from the tree's root, and only
+        # pairs that haven't reached a leaf yet are stepped
+        values = X.ravel()
+        starts = np.repeat(np.arange(len(X)) * X.shape[1], len(self.roots))
+        nodes = np.tile(np.asarray(self.roots), len(X))
+        active = np.arange(len(nodes))
+        for level in range(self.depth):
+            current = nodes[active]
+            go_left = values[starts[active] + self.feature[current]] <= \
+                self.threshold[current]
+            following = self.children[current, (~go_left).view(np.int8)]
+            nodes[active] = following
+            active = active[following != current]
+            if not len(active):
+                break
+        return nodes.reshape(len(X), len(self.roots))
+
+    def _mean_value(self, X):
+        """
+        Returns the mean of the trees' leaf values for every row, adding
+        the trees up one at a time in order like sklearn does.
+        """
+        leaves = self.apply(X)
+        total = np.zeros((len(leaves),) + self.values.shape[1:])
+        for tree in range(leaves.shape[1]):
+            total += self.values[leaves[:, tree]]
+        total /= leaves.shape[1]
+        return total
+
+    def predict_proba(self, X):
+        """
+        Takes a 2d array (or dataframe) of features and returns the class
+        probabilities of every row, as a (rows, classes) array.
+        """
+        if self.classes_ is None:
+            raise AttributeError('regression forests have no predict_proba')
+        return self._mean_value(X)
+
+    def predict(self, X):
+        """
+        Takes a 2d array (or dataframe) of features and returns the
+        predicted value(s) (regressors) or class (classifiers) of every
+        row.
+        """
+        if self.classes_ is not None:
+            return self.classes_.take(self.predict_proba(X).argmax(axis=1))
+        prediction = self._mean_value(X)
+        return prediction[:, 0] if self.n_outputs_ == 1 else prediction
+
+
+def export_forest(model, path):
+    """
+    Takes a trained sklearn RandomForestRegressor or (single output)
+    RandomForestClassifier, and exports it to a directory at the given path
+    (replacing any there). The directory is written next to the target and
+    moved into place at the end.
+    """
+    classes = getattr(model, 'classes_', None)
+    if classes is not None and model.n_outputs_ != 1:
+        raise ValueError('only single output classifiers can be exported')
+
+    trees = [estimator.tree_ for estimator in model.estimators_]
+    offsets = np.cumsum([0] + [tree.node_count for tree in trees])
+    arrays = {name: [] for name in FOREST_ARRAYS if name != 'roots'}
+
+    for tree, offset in zip(trees, offsets):
+        leaf = tree.children_left == -1
+        nodes = np.arange(tree.node_count) + offset
+        arrays['feature'].append(np.where(leaf, 0, tree.feature))
+        arrays['threshold'].append(tree.threshold)
+        arrays['children'].append(np.where(
+            leaf[:, np.newaxis], nodes[:, np.newaxis],
+            np.stack([tree.children_left, tree.children_right], axis=1) +
+            offset))
+
+        if classes is None:
+            arrays['values'].append(tree.value[:, :, 0])
+        else:
+            # sklearn's trees turn leaf values into probabilities this way
+            proba = tree.value[:, 0, :len(classes)].copy()
+            normalizer = proba.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            proba /= normalizer
+            arrays['values'].append(proba)
+
+    arrays = {name: np.concatenate(parts) for name, parts in arrays.items()}
+    arrays['roots'] = offsets[:-1]
+    dtypes = {'roots': np.int32, 'feature': np.int32,
+              'threshold': np.float64, 'children': np.int32,
+              'values': np.float64}
+
+    tmp_path = path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_path, name + '.npy'),
+                np.ascontiguousarray(array, dtype=dtypes[name]))
+    if classes is not None:
+        np.save(os.path.join(tmp_path, 'classes.npy'), classes)
+    with open(os.path.join(tmp_path, 'forest.json'), 'w') as outfile:
+        json.dump({'depth': max(tree.max_depth for tree in trees),
+                   'n_features': int(model.n_features_in_),
+                   'n_outputs': int(model.n_outputs_)}, outfile)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+
+
+def load_forest(path):
+    """
+    Takes the path of an exported forest directory and returns a
+    ForestModel for it.
+    """
+    return ForestModel(path)
@@ -0,0 +1,134 @@
+"""
+Corey Zarkowski, Bryan Phan, Lawrence Lorbiecki -- CSE 163
+Syncing the pre-built data files from gist, used by init_data_gist in
+'player_predictor.py'. Every file is requested concurrently and
+conditionally (with the ETag/Last-Modified of the last sync, kept in a
+manifest next to the data), so a routine sync is one round trip of
+'304 Not Modified' replies. Downloads are checked against the size and
+digest the server declares and a pinned sha256: one given with the
+artifact, or, for an artifact marked immutable (e.g. a raw URL pinned to
+a commit), the sha256 of its first download, kept in the manifest. A
+download whose sha256 matches the last sync counts as unchanged.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+TIMEOUT = 30
+
+
+def load_manifest(path):
+    """
+    Returns the manifest of the last sync (a dict of artifact names to
+    their 'url', 'sha256', 'etag', 'last_modified' and 'synced_at', and
+    the 'pinned_sha256' of immutable ones), or an empty dict if there isn't
+    one.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as infile:
+        return json.load(infile)
+
+
+def save_manifest(path, manifest):
+    """
+    Writes a sync manifest, replacing the old one in one step.
+    """
+    with open(path + '.tmp', 'w') as outfile:
+        json.dump(manifest, outfile, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def verify_download(name, response, body, sha256=None):
+    """
+    Takes an artifact name, its response & body, and optionally its
+    expected sha256 (hex). Raises ValueError if the body's size doesn't
+    match Content-Length, or its digest doesn't match the server's Digest
+    header or the expected sha256.
+    """
+    length = response.headers.get('Content-Length')
+    if length is not None and 'Content-Encoding' not in response.headers \
+       and int(length) != len(body):
+        raise ValueError(name + ': got ' + str(len(body)) + ' of ' + length +
+                         ' bytes')
+
+    for digest in response.headers.get('Digest', '').split(','):
+        algorithm, _, value = digest.strip().partition('=')
+        if algorithm.lower() == 'sha-256' and \
+           base64.b64decode(value) != hashlib.sha256(body).digest():
+            raise ValueError(name + ': body doesn\'t match its Digest header')
+
+    if sha256 is not None and hashlib.sha256(body).hexdigest() != sha256:
+        raise ValueError(name + ': sha256 doesn\'t match the pinned one')
+
+
+def fetch_artifact(name, artifact, previous, force=False, timeout=TIMEOUT):
+    """
+    Takes an artifact name, its dict ('url', and optionally a pinned
+    'sha256' or 'immutable': True), its manifest entry from the last sync
+    (or None), and whether to fetch it unconditionally. Fetches it and
+    returns a tuple of the new body (None if it didn't change) and its new
+    manifest entry. Raises ValueError if the download fails its checks.
+    """
+    if previous is not None and previous.get('url') != artifact['url']:
+        previous = None
+    pinned = artifact.get('sha256')
+    if pinned is None and artifact.get('immutable') and previous is not None:
+        pinned = previous.get('pinned_sha256')
+    if force:
+        previous = None
+
+    headers = {}
+    if previous is not None:
+        if previous.get('etag'):
+            headers['If-None-Match'] = previous['etag']
+        if previous.get('last_modified'):
+            headers['If-Modified-Since'] = previous['last_modified']
+
+    response = requests.get(artifact['url'], headers=headers,
+                            timeout=timeout)
+    if response.status_code == 304 and previous is not None:
+        return None, dict(previous, synced_at=time.time())
+    response.raise_for_status()
+
+    body = response.content
+    verify_download(name, response, body, pinned)
+    entry = {'url': artifact['url'],
+             'sha256': hashlib.sha256(body).hexdigest(),
+             'etag': response.headers.get('ETag'),
+             'last_modified': response.headers.get('Last-Modified'),
+             'synced_at': time.time()}
+    if artifact.get('immutable'):
+        entry['pinned_sha256'] = pinned or entry['sha256']
+
+    if previous is not None and previous.get('sha256') == entry['sha256']:
+        return None, entry
+    return body, entry
+
+
+def sync_artifacts(artifacts, manifest_path, force=False):
+    """
+    Takes a dict of artifact names to artifact dicts (see fetch_artifact),
+    the manifest path, and whether to fetch everything unconditionally
+    (e.g. because the files the last sync produced are gone; pins are
+    still checked). Fetches every artifact concurrently, and returns a dict
+    of the names of the ones that changed to their new bodies, and the new
+    manifest. The manifest isn't saved, so that it can be saved once the
+    new files are in place.
+    """
+    manifest = load_manifest(manifest_path)
+
+    with ThreadPoolExecutor(max_workers=len(artifacts)) as pool:
+        futures = {name: pool.submit(fetch_artifact, name, artifact,
+                                     manifest.get(name), force)
+                   for name, artifact in artifacts.items()}
+        results = {name: future.result() for name, future in futures.items()}
+
+    changed = {name: body for name, (body, entry) in results.items()
+               if body is not None}
+    return changed, {name: entry for name, (body, entry) in results.items()}
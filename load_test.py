@@ -0,0 +1,208 @@
+"""
+Corey Zarkowski, Bryan Phan, Lawrence Lorbiecki -- CSE 163
+Load test for the scraper. Runs a full manual refresh (init_data_manual in
+'player_predictor.py') against the local mock site (see 'mock_site.py'),
+with the site's latency, errors and throttling and the scraper's limits
+set from the command line, and reports how fast pages came in, the
+latency of requests and pages (with retries & waits) as percentiles, the
+statuses served, and whether the refreshed player data came out right:
+
+    python load_test.py --players 500 --latency 0.05 --jitter 0.05 \
+        --error-rate 0.05 --max-rate 50 --output load_test.json
+
+On a synthesized site, the player data is checked against what the site's
+ground truth should produce. With --archive, the recorded pages are served
+instead, and the data is checked against a second refresh of the same
+pages with no faults. The refresh runs in a temporary directory, so the
+files in 'data' are never touched. Exits with status 1 if the refresh
+failed or its data was wrong.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+import pandas as pd
+import manual_utils
+import metrics
+import scrape_utils
+from mock_site import MockSite, add_site_arguments, build_site,\
+                      expected_players
+from player_predictor import init_data_manual
+from player_table import STAT_COLUMNS, format_player_table
+
+
+def run_refresh(site, verbose=False):
+    """
+    Takes a running MockSite, and runs a manual refresh against it in a
+    temporary directory (quietly, unless verbose). Returns the refreshed
+    player data (pandas df), or None if the refresh failed, and the error
+    message (None if it didn't).
+    """
+    manual_utils.use_sites(site.url, site.url + '/cbb')
+    scrape_utils.use_archive(None)
+    cwd = os.getcwd()
+    output = sys.stdout if verbose else io.StringIO()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+        try:
+            with contextlib.redirect_stdout(output):
+                init_data_manual(save_state=False)
+            return pd.read_csv(os.path.join('data', 'player_data.csv')), None
+        except Exception as error:
+            return None, type(error).__name__ + ': ' + str(error)
+        finally:
+            os.chdir(cwd)
+
+
+def compare_players(actual, expected):
+    """
+    Takes refreshed and expected player data (pandas dfs), and returns a
+    dict with the count of expected players, of those that are 'missing'
+    from the refreshed data, of 'extra' players in it, and of players
+    whose stats are 'mismatched', and whether the data is 'correct'.
+    """
+    def by_name(data):
+        data = format_player_table(data)
+        return data.assign(name=data['name'].astype(str))\
+            .set_index('name')[STAT_COLUMNS]
+
+    actual = by_name(actual)
+    expected = by_name(expected)
+    common = expected.index.intersection(actual.index)
+    found = actual.loc[common]
+    wanted = expected.loc[common]
+    same = ((found == wanted) | (found.isna() & wanted.isna())).all(axis=1)
+
+    result = {'expected': len(expected),
+              'missing': len(expected.index.difference(actual.index)),
+              'extra': len(actual.index.difference(expected.index)),
+              'mismatched': int((~same).sum())}
+    result['correct'] = not (result['missing'] or result['extra'] or
+                             result['mismatched'])
+    return result
+
+
+def main():
+    """
+    Runs the load test, prints the report, and writes it to the --output
+    file if given. Exits with status 1 if the refresh failed or its data
+    was wrong.
+    """
+    parser = argparse.ArgumentParser(description='Load test the scraper \
+                                                 against a local mock site')
+    add_site_arguments(parser)
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Scraper threads (see scrape_utils.py)')
+    parser.add_argument('--host-concurrency', type=int, default=None,
+                        help='Requests in flight per host')
+    parser.add_argument('--host-rate', type=float, default=0,
+                        help='Requests per second per host (0 for no \
+                             limit, the default here)')
+    parser.add_argument('--retries', type=int, default=None,
+                        help='Retries per page')
+    parser.add_argument('--backoff', type=float, default=0.1,
+                        help='Base retry backoff in seconds')
+    parser.add_argument('--output', default=None,
+                        help='File the JSON report is written to')
+    parser.add_argument('--verbose', action='store_true',
+                        help='Show the refresh\'s own output')
+    args = parser.parse_args()
+
+    pages, truth = build_site(args)
+    scrape_utils.configure(args.workers, args.host_concurrency,
+                           args.host_rate, args.retries, args.backoff)
+    site = MockSite(pages, args.latency, args.jitter, args.error_rate,
+                    args.max_rate, args.retry_after, args.seed).start()
+    print('load testing against ' + str(len(pages)) + ' pages on ' +
+          site.url + '...')
+
+    start = time.perf_counter()
+    actual, error = run_refresh(site, args.verbose)
+    seconds = time.perf_counter() - start
+    site.stop()
+    run = metrics.summary()
+
+    if error is not None:
+        players = {'correct': False}
+    else:
+        if truth is not None:
+            with contextlib.redirect_stdout(io.StringIO()):
+                expected = expected_players(truth)
+        else:
+            print('refreshing again with no faults for reference...')
+            reference = MockSite(pages).start()
+            expected, error = run_refresh(reference, args.verbose)
+            reference.stop()
+            if error is not None:
+                error = 'reference refresh: ' + error
+        players = compare_players(actual, expected) if error is None \
+            else {'correct': False}
+
+    fetched = run['distributions'].get('scrape.page_seconds', {'count': 0})
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'site': {key: getattr(args, key) for key in
+                 ['players', 'seed', 'archive', 'latency', 'jitter',
+                  'error_rate', 'max_rate', 'retry_after']},
+        'scraper': {'workers': scrape_utils.MAX_WORKERS,
+                    'host_concurrency': scrape_utils.HOST_CONCURRENCY,
+                    'host_rate': scrape_utils.HOST_RATE,
+                    'retries': scrape_utils.RETRIES,
+                    'backoff': scrape_utils.BACKOFF},
+        'seconds': seconds,
+        'pages': fetched['count'],
+        'pages_per_second': fetched['count'] / seconds,
+        'request_seconds': run['distributions'].get(
+            'scrape.request_seconds', {'count': 0}),
+        'page_seconds': fetched,
+        'requests': run['counters'].get('scrape.requests', 0),
+        'retries': run['counters'].get('scrape.retries', 0),
+        'wait_seconds': run['counters'].get('scrape.wait_seconds', 0),
+        'served': {str(status): served for status, served
+                   in sorted(site.stats['status'].items())},
+        'players': players,
+        'error': error
+    }
+
+    print('{:<24}{:>10.2f}'.format('seconds', seconds))
+    print('{:<24}{:>10}'.format('pages', report['pages']))
+    print('{:<24}{:>10.1f}'.format('pages/sec', report['pages_per_second']))
+    for name in ['request_seconds', 'page_seconds']:
+        print('{:<24}'.format(name) +
+              ''.join('  {} {:.3f}'.format(key, report[name][key])
+                      for key in ['p50', 'p90', 'p99', 'max']
+                      if key in report[name]))
+    print('{:<24}{:>10}'.format('requests', report['requests']))
+    print('{:<24}{:>10}'.format('retries', report['retries']))
+    print('{:<24}{}'.format('served', ', '.join(
+        status + ': ' + str(served)
+        for status, served in report['served'].items())))
+    if error is not None:
+        print('refresh failed: ' + error)
+    else:
+        print('{:<24}{:>10}'.format('players expected',
+                                    players['expected']))
+        print('{:<24}{:>10}'.format('missing', players['missing']))
+        print('{:<24}{:>10}'.format('extra', players['extra']))
+        print('{:<24}{:>10}'.format('mismatched', players['mismatched']))
+        print('player data is ' +
+              ('correct' if players['correct'] else 'WRONG'))
+
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            json.dump(report, outfile, indent=2)
+        print('report written to ' + args.output)
+
+    if not players['correct']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -7,11 +7,79 @@ NOTE: some lines go way over the line limit since regex really doesn't like it
 if you put it over multiple lines
 """
 
-import requests
 import re
 import string
+from datetime import date
+from functools import partial
+import numpy as np
+import pandas as pd
+import metrics
+from scrape_utils import fetch_parsed
+
+# sites scraped (see use_sites)
+NBA_URL = 'https://www.basketball-reference.com'
+CBB_URL = 'https://www.sports-reference.com/cbb'
+# name suffixes skipped when finding a player's last name
+NAME_SUFFIXES = {'jr', 'sr', 'ii', 'iii', 'iv', 'v'}
+# seconds stored college stats of players still in college stay fresh
+COLLEGE_TTL = 24 * 60 * 60
+
+# stat header on a college player's page -> field in the player's dict. The
+# value for a header is on the line right after it.
+COLLEGE_STAT_FIELDS = {
+    b'G': 'Games',
+    b'PTS': 'Points',
+    b'TRB': 'Rebounds',
+    b'AST': 'Assists',
+    b'FG%': 'FGP',
+    b'FG3%': 'TFGP',
+    b'FT%': 'FTP',
+    b'eFG%': 'EFGP',
+    b'WS': 'WS'
+}
+COLLEGE_STAT_HEADER = re.compile(
+    rb'data-tip="[^"]*"><strong>(' +
+    b'|'.join(re.escape(header) for header in COLLEGE_STAT_FIELDS) +
+    rb')</strong>')
+COLLEGE_STAT_VALUE = re.compile(rb'<p>([\d.]*)</p></div>')
+
+# data-stat column on a season totals page -> column in the season table
+SEASON_STAT_FIELDS = {
+    b'pts': 'points',
+    b'trb': 'rebounds',
+    b'stl': 'steals',
+    b'ast': 'assists',
+    b'blk': 'blocks',
+    b'g': 'games',
+    b'mp': 'minutes'
+}
+SEASON_ROW = b'data-stat="player" csk="'
+SEASON_PARTIAL_ROW = b'class="italic_text partial_table"'
+SEASON_PLAYER = re.compile('data-stat="player" csk="[^"]*" ><a href="/players/[^>]*>([^<]*)</a></td>')
+SEASON_STAT = re.compile(rb'data-stat="(' +
+                         b'|'.join(SEASON_STAT_FIELDS) +
+                         rb')" >(\d*)</td>')
+
+_college_store = None
+_college_ttl = COLLEGE_TTL
+
+
+def use_sites(nba_url=None, cbb_url=None):
+    """
+    Points the scrapers (here and in 'refresh_utils.py') at other copies of
+    basketball-reference and sports-reference's college pages, e.g. the
+    local mock site (see 'mock_site.py'). A URL left as None keeps its
+    current value.
+    """
+    global NBA_URL, CBB_URL
+
+    if nba_url is not None:
+        NBA_URL = nba_url
+    if cbb_url is not None:
+        CBB_URL = cbb_url
 
 
+@metrics.stage('nba_player_urls')
 def fetch_nba_player_URLs():
     """
     Scrapes nba player names and URLs by going through the basketball-
@@ -20,266 +88,427 @@ def fetch_nba_player_URLs():
     """
     print('fetching nba player urls...')
 
-    letters = list(string.ascii_lowercase)
     players = {}
+    pages = [(NBA_URL + '/players/' + letter + '/',
+              partial(parse_nba_index_page, letter=letter))
+             for letter in string.ascii_lowercase]
+
+    for URL, page_players in fetch_parsed(pages):
+        players.update(page_players)
+
+    metrics.count('parse.nba_players', len(players))
+    return players
 
-    for letter in letters:
-        URL = 'https://www.basketball-reference.com/players/' + letter + '/'
-        data = requests.get(URL, stream=True)
 
-        for line in data.iter_lines():
-            match = re.findall('data-stat="player" ><a href="/players/' +
-                               letter + '/([^>]*)">([^<]*)<', str(line))
+def parse_nba_index_page(data, letter):
+    """
+    Takes the body of a basketball-reference player index page (bytes) and
+    its letter, and returns a dict of the player names on it to URLs.
+    """
+    players = {}
 
-            if(match):
-                players[match[0][1]] = match[0][0]
+    for line in data.splitlines():
+        match = re.findall('data-stat="player" ><a href="/players/' +
+                           letter + '/([^>]*)">([^<]*)<', str(line))
+
+        if(match):
+            players[match[0][1]] = match[0][0]
 
     return players
 
 
-def fetch_cbb_player_URLs():
+@metrics.stage('cbb_player_urls')
+def fetch_cbb_player_URLs(letters=string.ascii_lowercase):
     """
     Scrapes college player names and URLs by going through the sports-
-    reference alphabetical player index. Returns a dict of player names to
-    URLs as key-value pairs.
+    reference alphabetical player index, for the given last name initials
+    (all of them by default). Returns a dict of player names to URLs as
+    key-value pairs.
     """
     print('fetching cbb player urls...')
 
-    letters = list(string.ascii_lowercase)
     players_cbb = {}
+    pages = [(CBB_URL + '/players/' + letter + '-index.html',
+              parse_cbb_index_page) for letter in letters]
 
-    for letter in letters:
-        URL = 'https://www.sports-reference.com/cbb/players/' +\
-              letter + '-index.html'
-        data = requests.get(URL, stream=True)
-        for line in data.iter_lines():
-            match = re.findall('p><a href="/cbb/players([^"]*)">([^<]*)',
-                               str(line))
-            if match:
-                players_cbb[match[0][1]] = match[0][0]
+    for URL, page_players in fetch_parsed(pages):
+        players_cbb.update(page_players)
 
+    metrics.count('parse.cbb_players', len(players_cbb))
     return players_cbb
 
 
-def fetch_nba_career_data(players):
+def index_letter(name):
+    """
+    Takes a player's name and returns the letter of the sports-reference
+    index page they're listed on (their last name's initial, lowercase,
+    skipping suffixes like 'Jr.' or 'III'), or None for an empty name.
+    """
+    words = name.split()
+    while len(words) > 1 and words[-1].rstrip('.,').lower() in NAME_SUFFIXES:
+        words.pop()
+    return words[-1][0].lower() if words else None
+
+
+def parse_cbb_index_page(data):
     """
-    Scrapes NBA career data by going through total player stats for each
-    season, and appending seasonal totals to the previously created player
-    dict. Returns the updated player dict.
+    Takes the body of a sports-reference college player index page (bytes)
+    and returns a dict of the player names on it to URLs.
+    """
+    players_cbb = {}
+
+    for line in data.splitlines():
+        match = re.findall('p><a href="/cbb/players([^"]*)">([^<]*)',
+                           str(line))
+        if match:
+            players_cbb[match[0][1]] = match[0][0]
+
+    return players_cbb
+
+
+@metrics.stage('nba_seasons')
+def fetch_nba_career_data(players, first_year=1950, last_year=2021):
+    """
+    Takes a dict of nba player names to URLs (or None to keep every player
+    on the pages) and scrapes the total stats page for every season from
+    first_year to last_year (ints). Returns a
+    season table (pandas df) with one row per (player, season), indexed by
+    'name' and 'year', with a float32 column per stat in SEASON_STAT_FIELDS
+    (NaN where the page left the stat blank).
     """
     print('retrieving nba career data...')
-    player_data_by_year = {}
+    if players is not None:
+        players = set(players)
+    years = range(first_year, last_year + 1)
+    pages = [(NBA_URL + '/leagues/NBA_' + str(year) + '_totals.html',
+              parse_season_page) for year in years]
+
+    names = []
+    seasons = []
+    stats = {column: [] for column in SEASON_STAT_FIELDS.values()}
+
+    for year, (URL, rows) in zip(years, fetch_parsed(pages)):
+        if (year - first_year) % 5 == 0:
+            print(str(int((year - first_year) / len(years) * 100)) + '%')
+
+        metrics.count('parse.season_rows', len(rows))
+        for name, row in rows:
+            if players is not None and name not in players:
+                metrics.count('parse.season_rows_dropped')
+                continue
+            names.append(name)
+            seasons.append(year)
+            for column in stats:
+                stats[column].append(row[column])
+
+    return build_season_table(names, seasons, stats)
+
+
+def build_season_table(names, seasons, stats):
+    """
+    Takes lists of player names & seasons (one per row) and a dict of stat
+    columns to lists of values, and returns them as a season table (see
+    fetch_nba_career_data). For duplicate (player, season) rows, the last
+    one is kept.
+    """
+    season_table = pd.DataFrame({
+        'name': pd.Categorical(names),
+        'year': np.asarray(seasons, dtype=np.int16),
+        **{column: np.asarray(values, dtype=np.float32)
+           for column, values in stats.items()}
+    })
+
+    season_table = season_table.drop_duplicates(['name', 'year'],
+                                                keep='last')
+    metrics.count('parse.season_rows_dropped', len(names) - len(season_table))
+
+    return season_table.set_index(['name', 'year']).sort_index()
 
-    for year in range(1950, 2022):
-        if (year - 1950) % 5 == 0:
-            print(str(int((year - 1950) / 72 * 100)) + '%')
 
-        URL = 'https://www.basketball-reference.com/leagues/NBA_' + \
-              str(year) + '_totals.html'
-        data = requests.get(URL, stream=True)
-        for line in data.iter_lines():
-            match = re.findall('data-stat="player" csk="[^"]*" ><a href="/players/[^>]*>([^<]*)</a></td>',
-                               str(line))
-            match2 = re.findall('class="italic_text partial_table"', str(line))
+def parse_season_page(data, players=None):
+    """
+    Takes the body of a season totals page (bytes) and optionally a set of
+    player names to keep, and returns a list of (name, stats) tuples, one
+    per player row (rows for single teams of traded players are skipped).
+    Stats are a dict with a float per column in SEASON_STAT_FIELDS (NaN
+    where the page left the stat blank).
+    """
+    rows = []
+
+    for line in data.splitlines():
+        if SEASON_ROW not in line or SEASON_PARTIAL_ROW in line:
+            continue
+
+        match = SEASON_PLAYER.search(str(line))
+        if not match or (players is not None and
+                         match.group(1) not in players):
+            continue
 
-            if match and not match2 and match[0] in players.keys():
-                if match[0] not in player_data_by_year.keys():
-                    player_data_by_year[match[0]] = {}
+        row = dict(SEASON_STAT.findall(line))
+        rows.append((match.group(1), {
+            column: float(row[stat]) if row.get(stat) else np.nan
+            for stat, column in SEASON_STAT_FIELDS.items()
+        }))
 
-                player_data_by_year[match[0]][year] = {}
+    return rows
 
-                match_points = re.findall('data-stat="pts" >([\d]*)</td>',
-                                          str(line))
-                if match_points:
-                    player_data_by_year[match[0]][year]['points'] = match_points[0]
 
-                match_rebounds = re.findall('data-stat="trb" >([\d]*)</td>',
-                                            str(line))
-                if match_rebounds:
-                    player_data_by_year[match[0]][year]['rebounds'] = match_rebounds[0]
+def current_season(today=None):
+    """
+    Returns the year the nba season in progress (or the next one, in the
+    offseason) ends in, which is how basketball-reference names seasons.
+    Uses today's date unless another date is given.
+    """
+    today = today or date.today()
+    return today.year + 1 if today.month >= 10 else today.year
 
-                match_steals = re.findall('data-stat="stl" >([\d]*)</td>',
-                                          str(line))
-                if match_steals:
-                    player_data_by_year[match[0]][year]['steals'] = match_steals[0]
 
-                match_assists = re.findall('data-stat="ast" >([\d]*)</td>',
-                                           str(line))
-                if match_assists:
-                    player_data_by_year[match[0]][year]['assists'] = match_assists[0]
+def season_closed(year, fetched_on):
+    """
+    Takes a season (int) and the date its totals were fetched, and returns
+    whether the regular season was already over then, meaning the fetched
+    totals are final.
+    """
+    return fetched_on >= date(year, 7, 1)
 
-                match_blocks = re.findall('data-stat="blk" >([\d]*)</td>',
-                                          str(line))
-                if match_blocks:
-                    player_data_by_year[match[0]][year]['blocks'] = match_blocks[0]
 
-    return player_data_by_year
+def score_product(season_table):
+    """
+    Takes a season table and returns each season's points x rebounds x
+    steals x assists x blocks (pandas series). Seasons with any of those
+    left blank get NaN, so they aren't rated.
+    """
+    return season_table[['points', 'rebounds', 'steals', 'assists',
+                         'blocks']].astype(np.float64)\
+        .prod(axis=1, skipna=False)
 
 
-def format_career_data(player_data_by_year):
+def score_weighted_sum(weights):
+    """
+    Takes a dict of season table columns to weights (floats) and returns a
+    scoring function that rates each season by the weighted sum of those
+    stats. Blank stats count as 0, and only seasons with every stat blank
+    go unrated.
     """
-    Takes the previously created player data dict, and uses it to calculate
-    career length & best year. Returns an updated dict with those fields
-    included.
+    def score(season_table):
+        columns = list(weights.keys())
+        return (season_table[columns].astype(np.float64) *
+                pd.Series(weights)).sum(axis=1, min_count=1)
+
+    return score
+
+
+def score_per_minute(columns=('points', 'rebounds', 'steals', 'assists',
+                              'blocks')):
+    """
+    Takes season table columns and returns a scoring function that rates
+    each season by the sum of those stats per minute played. Seasons
+    without minutes or with any of the stats blank go unrated.
+    """
+    def score(season_table):
+        minutes = season_table['minutes'].astype(np.float64)
+        return season_table[list(columns)].astype(np.float64)\
+            .sum(axis=1, skipna=False) / minutes.where(minutes > 0)
+
+    return score
+
+
+@metrics.stage('format_careers')
+def format_career_data(season_table, score=score_product):
+    """
+    Takes the season table from fetch_nba_career_data and a scoring function
+    (season table -> series of season scores, NaN for seasons it can't
+    rate), and calculates every player's career length (rated seasons) &
+    best year (which of those seasons scored highest) in one pass. Players
+    whose best season doesn't score above 0 are left out. Returns a career
+    table (pandas df) indexed by 'name' with 'best_year' and
+    'career_length' columns.
     """
     print('formatting career data...')
 
-    player_data_noyear = {}
+    scores = score(season_table).dropna()
+    print(str(len(season_table) - len(scores)) + ' unrated seasons dropped')
+
+    by_player = scores.groupby(level='name', observed=True)
+    season_number = by_player.cumcount() + 1
+    best_score = by_player.transform('max')
+    best = (scores == best_score) & (best_score > 0)
+
+    careers = pd.DataFrame({
+        'best_year': season_number[best].groupby(level='name',
+                                                 observed=True).first(),
+        'career_length': by_player.size()
+    }).dropna().astype(int)
+    careers.index = careers.index.astype(str)
+    metrics.count('format.seasons_dropped', len(season_table) - len(scores))
+    metrics.count('format.players', len(careers))
+    metrics.count('format.players_dropped',
+                  scores.index.unique('name').size - len(careers))
+
+    return careers
+
+
+def save_season_table(season_table, path):
+    """
+    Takes a season table and writes it to a csv file at the given path, so
+    careers can be re-scored without scraping again.
+    """
+    season_table.to_csv(path)
+
+
+def load_season_table(path):
+    """
+    Reads a season table written by save_season_table and returns it with
+    the same index & dtypes fetch_nba_career_data gives.
+    """
+    season_table = pd.read_csv(path, dtype={'name': 'category',
+                                            'year': np.int16})
+    stat_columns = [column for column in season_table.columns
+                    if column not in ('name', 'year')]
+    season_table[stat_columns] = season_table[stat_columns]\
+        .astype(np.float32)
+
+    return season_table.set_index(['name', 'year']).sort_index()
+
+
+def use_college_store(store, ttl=COLLEGE_TTL):
+    """
+    Takes a CollegeStore (or None to stop using one, see 'college_store.py')
+    and a TTL in seconds. College stats are looked up in the store before
+    fetching, and fetched stats are saved to it. Stored stats of players
+    whose college careers are over never expire, and others do after ttl.
+    """
+    global _college_store, _college_ttl
+
+    _college_store = store
+    _college_ttl = ttl
 
-    for player_name in player_data_by_year.keys():
-        best_year = -1
-        cur_year = 1
-        stat_total = 0
-        cur_stat_total = 0
 
-        for year in player_data_by_year[player_name]:
-            stats = [player_data_by_year[player_name][year][stat] for
-                     stat in player_data_by_year[player_name][year]]
+def college_stats(player_urls, finished=(), errors=False):
+    """
+    Takes a list of urls for college basketball players and a collection of
+    the ones whose college careers are over. Yields a dict with each one's
+    total career stats, in the same order. Stats in the college store are
+    served from it, and the rest are fetched concurrently (and stored). A
+    page that can't be fetched raises its error, or with errors, the error
+    (an exception) is yielded in place of its stats.
+    """
+    stored = {}
+    if _college_store is not None:
+        stored = _college_store.lookup(player_urls, _college_ttl)
+    metrics.count('college_store.hits', sum(url in stored
+                                            for url in player_urls))
+    metrics.count('college_store.misses', sum(url not in stored
+                                              for url in player_urls))
+
+    missing = list(dict.fromkeys(url for url in player_urls
+                                 if url not in stored))
+    fetched = fetch_parsed([(CBB_URL + '/players' + player_url,
+                             parse_college_player_page)
+                            for player_url in missing], errors=errors)
+
+    for player_url in player_urls:
+        if player_url not in stored:
+            stats = next(fetched)[1]
+            if isinstance(stats, Exception):
+                yield stats
+                continue
+            stats = count_college_stats([stats])[0]
+            if _college_store is not None:
+                # pages nothing could be parsed from are retried once they
+                # expire (many finished careers just lack some stats)
+                _college_store.save(player_url, stats,
+                                    player_url in finished and bool(stats))
+            stored[player_url] = stats
+        yield stored[player_url]
+
+
+def fetch_college_player_data(player_url, finished=False):
+    """
+    Takes a url for a college basketball player (and whether their college
+    career is over) and returns a dict with their total career stats.
+    """
+    return next(college_stats([player_url],
+                              [player_url] if finished else ()))
 
-            if '' not in stats:
-                cur_stat_total = int(player_data_by_year[player_name][year]['points']) * \
-                                 int(player_data_by_year[player_name][year]['rebounds']) * \
-                                 int(player_data_by_year[player_name][year]['steals']) * \
-                                 int(player_data_by_year[player_name][year]['assists']) * \
-                                 int(player_data_by_year[player_name][year]['blocks'])
-                if cur_stat_total > stat_total:
-                    stat_total = cur_stat_total
-                    best_year = cur_year
-                cur_year += 1
 
-        if best_year != -1:
-            player_data_noyear[player_name] = {}
-            player_data_noyear[player_name]['best_year'] = best_year
-            player_data_noyear[player_name]['career_length'] = cur_year - 1
+@metrics.stage('college_stats')
+def fetch_college_players_data(player_urls, finished=(), errors=False):
+    """
+    Takes a list of urls for college basketball players (and a collection
+    of the ones whose college careers are over) and returns a list of dicts
+    with their total career stats, in the same order. The pages not in the
+    college store are fetched concurrently. With errors, a page that can't
+    be fetched gets its error (an exception) in place of its stats instead
+    of raising it.
+    """
+    return list(college_stats(player_urls, finished, errors))
 
-    return player_data_noyear
 
+def count_college_stats(college_stats):
+    """
+    Takes a list of parsed college stat dicts, counts how many were parsed
+    & how many were missing stats (see 'metrics.py'), and returns the list.
+    """
+    metrics.count('parse.college_pages', len(college_stats))
+    metrics.count('parse.college_pages_incomplete',
+                  sum(len(stats) < len(COLLEGE_STAT_FIELDS)
+                      for stats in college_stats))
+    return college_stats
 
-def fetch_college_player_data(player_url):
+
+def parse_college_player_page(data):
     """
-    Takes a url for a college basketball player and returns a dict with
-    their total career stats.
+    Takes the body of a college player's page, either as bytes (e.g. read
+    from disk) or as an iterable of byte lines, and returns a dict with
+    their total career stats. Stat headers are looked up in
+    COLLEGE_STAT_FIELDS, and reading stops once every field is found.
     """
-    URL = 'https://www.sports-reference.com/cbb/players' + player_url
-    data = requests.get(URL, stream=True)
+    if isinstance(data, (bytes, bytearray)):
+        data = data.splitlines()
+
     cur_player = {}
+    pending = []
 
-    games_line = False
-    points_line = False
-    rebounds_line = False
-    assists_line = False
-    fgp_line = False
-    tfgp_line = False
-    ftp_line = False
-    efgp_line = False
-    ws_line = False
-
-    for line in data.iter_lines():
-        if games_line:
-            match = re.findall('<p>([\d]*)</p></div>', str(line))
+    for line in data:
+        if pending:
+            match = COLLEGE_STAT_VALUE.search(line)
             if match:
-                cur_player['Games'] = match[0]
-            games_line = False
-        if points_line:
-            match = re.findall('<p>([\d.]*)</p></div>', str(line))
-            if match:
-                cur_player['Points'] = match[0]
-            points_line = False
-        if rebounds_line:
-            match = re.findall('<p>([\d.]*)</p></div>', str(line))
-            if match:
-                cur_player['Rebounds'] = match[0]
-            rebounds_line = False
-        if assists_line:
-            match = re.findall('<p>([\d.]*)</p></div>', str(line))
-            if match:
-                cur_player['Assists'] = match[0]
-            assists_line = False
-        if fgp_line:
-            match = re.findall('<p>([\d.]*)</p></div>', str(line))
-            if match:
-                cur_player['FGP'] = match[0]
-            fgp_line = False
-        if tfgp_line:
-            match = re.findall('<p>([\d.]*)</p></div>', str(line))
-            if match:
-                cur_player['TFGP'] = match[0]
-            tfgp_line = False
-        if ftp_line:
-            match = re.findall('<p>([\d.]*)</p></div>', str(line))
-            if match:
-                cur_player['FTP'] = match[0]
-            ftp_line = False
-        if efgp_line:
-            match = re.findall('<p>([\d.]*)</p></div>', str(line))
-            if match:
-                cur_player['EFGP'] = match[0]
-            efgp_line = False
-        if ws_line:
-            match = re.findall('<p>([\d.]*)</p></div>', str(line))
-            if match:
-                cur_player['WS'] = match[0]
-            ws_line = False
-
-        match_games = re.findall('data-tip="Games"><strong>G</strong>',
-                                 str(line))
-        match_points = re.findall('data-tip="Points"><strong>PTS</strong>',
-                                  str(line))
-        match_rebounds = re.findall('data-tip="Total Rebounds"><strong>TRB</strong>',
-                                    str(line))
-        match_assists = re.findall('data-tip="Assists"><strong>AST</strong>',
-                                   str(line))
-        match_fgp = re.findall('data-tip="Field Goal Percentage"><strong>FG%</strong>',
-                               str(line))
-        match_tfgp = re.findall('data-tip="3-Point Field Goal Percentage"><strong>FG3%</strong>',
-                                str(line))
-        match_ftp = re.findall('data-tip="Free Throw Percentage"><strong>FT%</strong>',
-                               str(line))
-        match_efgp = re.findall('data-tip="Effective Field Goal Percentage; this statistic adjusts for the fact that a 3-point field goal is worth one more point than a 2-point field goal."><strong>eFG%</strong>',
-                                str(line))
-        match_ws = re.findall('data-tip="Win Shares; an estimate of the number of wins contributed by a player due to his offense and defense."><strong>WS</strong>',
-                              str(line))
-
-        if match_games:
-            games_line = True
-        if match_points:
-            points_line = True
-        if match_rebounds:
-            rebounds_line = True
-        if match_assists:
-            assists_line = True
-        if match_fgp:
-            fgp_line = True
-        if match_tfgp:
-            tfgp_line = True
-        if match_ftp:
-            ftp_line = True
-        if match_efgp:
-            efgp_line = True
-        if match_ws:
-            ws_line = True
+                for field in pending:
+                    cur_player.setdefault(field, match.group(1).decode())
+                if len(cur_player) == len(COLLEGE_STAT_FIELDS):
+                    break
+            pending = []
+
+        for header in COLLEGE_STAT_HEADER.findall(line):
+            pending.append(COLLEGE_STAT_FIELDS[header])
 
     return cur_player
 
 
-def fetch_college_data(players_cbb, player_data_noyear):
+@metrics.stage('college_stats')
+def fetch_college_data(players_cbb, players):
     """
-    Takes dicts of college players/urls & nba players. Scrapes college data for
-    every nba player given and adds it to the nba player dict.
+    Takes a dict of college players/urls & an iterable of nba player names
+    (e.g. the index of the career table). Scrapes college data for every
+    nba player with a college page, and returns a dict of those player
+    names to their college stats.
     """
     print('fetching college data for nba players...')
     print('this may take a while')
 
     count = 0
+    college_data = {}
+    players = [player for player in players if player in players_cbb]
+    player_urls = [players_cbb[player] for player in players]
 
-    for player in player_data_noyear.keys():
+    # nba players are done with college
+    for player, stats in zip(players, college_stats(player_urls,
+                                                    set(player_urls))):
         count += 1
         if count % 100 == 0:
-            print(str(int(count / len(player_data_noyear.keys()) * 100)) + '%')
-
-        if player not in players_cbb.keys():
-            continue
+            print(str(int(count / len(players) * 100)) + '%')
 
-        player_data_noyear[player] = fetch_college_player_data(players_cbb[player])
+        college_data[player] = stats
 
-    return player_data_noyear
+    return college_data
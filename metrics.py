@@ -0,0 +1,177 @@
+"""
+Corey Zarkowski, Bryan Phan, Lawrence Lorbiecki -- CSE 163
+Instrumentation for the data pipeline. The scraper, parsers, career
+formatter, trainer and predictor report into it: stages record their
+wall & CPU time (CPU time well under wall time means the stage was
+waiting, e.g. on the network; work done in other processes, like the
+--reparse parsing pool, isn't counted), counters record things like
+requests, bytes downloaded, retries, cache hits/misses and rows parsed or
+dropped, and distributions record samples like request latencies, summed
+up as percentiles.
+
+Recording is always on and cheap. With 'player_predictor.py --metrics
+FILE', every stage is also written to FILE as a JSON line when it ends,
+followed by a summary of the run, and the summary is printed at the end.
+"""
+
+import atexit
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+_lock = threading.Lock()
+_counters = {}
+_stages = {}
+_samples = {}
+_run = {'output': None, 'id': None, 'started': time.perf_counter(),
+        'cpu_started': time.process_time()}
+
+
+def count(name, value=1):
+    """
+    Adds value (1 by default) to the counter with the given name. Counters
+    named '<name>.hits' & '<name>.misses' get a hit rate in the summary.
+    """
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def observe(name, value):
+    """
+    Adds a sample (e.g. a request's latency in seconds) to the distribution
+    with the given name. The summary reports its percentiles.
+    """
+    with _lock:
+        _samples.setdefault(name, []).append(value)
+
+
+def percentiles(values):
+    """
+    Takes a list of samples and returns a dict with their count, mean,
+    median, 90th/99th percentiles (nearest rank) and max.
+    """
+    values = sorted(values)
+    if not values:
+        return {'count': 0}
+
+    def rank(share):
+        return values[min(len(values) - 1, int(share * len(values)))]
+
+    return {'count': len(values), 'mean': sum(values) / len(values),
+            'p50': rank(0.5), 'p90': rank(0.9), 'p99': rank(0.99),
+            'max': values[-1]}
+
+
+@contextmanager
+def stage(name):
+    """
+    Context manager (or function decorator) that records the code run in
+    it as a call of the named stage, with its wall & CPU time and the
+    counters it changed.
+    """
+    with _lock:
+        before = dict(_counters)
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        cpu_seconds = time.process_time() - cpu_start
+        with _lock:
+            totals = _stages.setdefault(name, {'calls': 0, 'seconds': 0.0,
+                                               'cpu_seconds': 0.0})
+            totals['calls'] += 1
+            totals['seconds'] += seconds
+            totals['cpu_seconds'] += cpu_seconds
+            changed = {counter: value - before.get(counter, 0)
+                       for counter, value in _counters.items()
+                       if value != before.get(counter, 0)}
+        emit({'event': 'stage', 'stage': name, 'seconds': seconds,
+              'cpu_seconds': cpu_seconds, 'counters': changed})
+
+
+def emit(record):
+    """
+    Writes a record (dict) as a JSON line to the metrics file, if there is
+    one, tagged with the run id and time.
+    """
+    if _run['output'] is None:
+        return
+    record = {'run': _run['id'], 'time': time.time(), **record}
+    with _lock:
+        _run['output'].write(json.dumps(record) + '\n')
+        _run['output'].flush()
+
+
+def start(path):
+    """
+    Starts writing metrics as JSON lines to the given file (appended to,
+    so runs can be tracked over time). The summary is written & printed
+    when the process exits, even if it fails.
+    """
+    _run['id'] = datetime.now().isoformat(timespec='seconds')
+    _run['output'] = open(path, 'a')
+    emit({'event': 'start', 'argv': sys.argv[1:]})
+    atexit.register(finish)
+
+
+def summary():
+    """
+    Returns a dict summarizing the run so far: total wall & CPU time, the
+    totals of every stage, every counter, hit rates, and the percentiles of
+    every distribution.
+    """
+    with _lock:
+        counters = dict(_counters)
+        stages = {name: dict(totals) for name, totals in _stages.items()}
+        samples = {name: list(values) for name, values in _samples.items()}
+
+    hit_rates = {}
+    for counter in counters:
+        if counter.endswith('.hits'):
+            name = counter[:-len('.hits')]
+            total = counters[counter] + counters.get(name + '.misses', 0)
+            hit_rates[name] = counters[counter] / total if total else 0.0
+
+    return {'seconds': time.perf_counter() - _run['started'],
+            'cpu_seconds': time.process_time() - _run['cpu_started'],
+            'stages': stages, 'counters': counters, 'hit_rates': hit_rates,
+            'distributions': {name: percentiles(values)
+                              for name, values in samples.items()}}
+
+
+def finish(out=None):
+    """
+    Writes the run summary to the metrics file (if any) and prints it, to
+    stderr by default.
+    """
+    out = out or sys.stderr
+    run = summary()
+    emit({'event': 'summary', **run})
+    if _run['output'] is not None:
+        _run['output'].close()
+        _run['output'] = None
+
+    print('{:<24}{:>7}{:>10}{:>10}'.format('stage', 'calls', 'wall',
+                                          'cpu'), file=out)
+    for name, totals in run['stages'].items():
+        print('{:<24}{:>7}{:>9.2f}s{:>9.2f}s'.format(
+            name, totals['calls'], totals['seconds'],
+            totals['cpu_seconds']), file=out)
+    print('{:<24}{:>7}{:>9.2f}s{:>9.2f}s'.format(
+        'total', '', run['seconds'], run['cpu_seconds']), file=out)
+    for name, value in sorted(run['counters'].items()):
+        print('{:<31}{:>12}'.format(
+            name, round(value, 2) if isinstance(value, float) else value),
+            file=out)
+    for name, rate in sorted(run['hit_rates'].items()):
+        print('{:<31}{:>11.0%}'.format(name + ' hit rate', rate), file=out)
+    for name, spread in sorted(run['distributions'].items()):
+        print('{:<31}{:>12}'.format(name, spread['count']) +
+              ''.join('  {} {:.3f}'.format(key, spread[key])
+                      for key in ['p50', 'p90', 'p99', 'max']
+                      if key in spread), file=out)
@@ -0,0 +1,420 @@
+"""
+Corey Zarkowski, Bryan Phan, Lawrence Lorbiecki -- CSE 163
+Local stand-in for basketball-reference and sports-reference's college
+pages, for exercising the scraper without the live sites (see
+'load_test.py'). It serves either a synthesized site, generated with known
+stats in the markup the parsers in 'manual_utils.py' expect (player
+indexes, season totals and college player pages), or the pages recorded
+in a page archive (see 'page_archive.py'). Responses can be slowed down,
+fail with server errors, and be throttled like the real sites do.
+
+Both sites are served from one address: the nba pages at its root, and
+the college pages under '/cbb'. To serve a synthesized site on port 8000:
+
+    python mock_site.py --port 8000 --latency 0.05 --error-rate 0.02
+"""
+
+import argparse
+import hashlib
+import random
+import string
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+import numpy as np
+import pandas as pd
+from manual_utils import COLLEGE_STAT_FIELDS, SEASON_STAT_FIELDS,\
+                         current_season
+
+FIRST_NAMES = ['Aaron', 'Ben', 'Chris', 'Dan', 'Eric', 'Frank', 'Greg',
+               'Hank', 'Ian', 'Jake', 'Kyle', 'Luke', 'Mike', 'Nate',
+               'Omar', 'Paul', 'Ray', 'Sam', 'Tom', 'Will']
+LAST_PREFIXES = ['Ab', 'Bel', 'Car', 'Dun', 'Ell', 'Fos', 'Gar', 'Har',
+                 'Ing', 'Jor', 'Kel', 'Lan', 'Mor', 'Nel', 'Ost', 'Par',
+                 'Quin', 'Ros', 'Sto', 'Tur', 'Und', 'Val', 'Wes', 'Yor',
+                 'Zan']
+LAST_SUFFIXES = ['ton', 'son', 'man', 'ley', 'ford', 'well', 'er', 'ing']
+# first season of the synthesized site (the refresh starts in 1950)
+FIRST_YEAR = 1950
+# seasons steals & blocks started being recorded, like on the real site
+BLOCKS_STEALS_YEAR = 1974
+# generic markup that pads pages out to a realistic size
+FILLER_LINE = b'<div class="filler"><a href="/about/">About</a>' \
+              b'<span data-tip="nav">Navigation</span></div>'
+PADDING = 300
+
+
+def player_names(count, rng):
+    """
+    Returns a list of count unique made-up player names.
+    """
+    names = [first + ' ' + prefix + suffix for first in FIRST_NAMES
+             for prefix in LAST_PREFIXES for suffix in LAST_SUFFIXES]
+    if count > len(names):
+        raise ValueError('at most ' + str(len(names)) + ' players')
+    return [names[i] for i in rng.choice(len(names), count, replace=False)]
+
+
+def page(title, lines):
+    """
+    Returns a page (bytes) with the given title and body lines, padded
+    with filler markup.
+    """
+    return b'\n'.join([b'<!DOCTYPE html>', b'<html><head><title>' +
+                       title.encode() + b'</title></head>'] +
+                      [FILLER_LINE] * PADDING + lines +
+                      [FILLER_LINE] * PADDING + [b'</html>'])
+
+
+def nba_slug(name):
+    """
+    Returns the basketball-reference page slug of a player, e.g.
+    'smithjo01.html'.
+    """
+    first, last = name.split(' ', 1)
+    return (last[:5] + first[:2]).lower() + '01.html'
+
+
+def cbb_slug(name):
+    """
+    Returns the sports-reference college page path of a player (relative
+    to '/cbb/players'), e.g. '/john-smith-1.html'.
+    """
+    return '/' + name.lower().replace(' ', '-') + '-1.html'
+
+
+def season_row(rank, name, stats, partial=False):
+    """
+    Returns a player row (bytes) of a season totals page with the given
+    stats (dict of SEASON_STAT_FIELDS columns to numbers, NaN for blank).
+    """
+    first, last = name.split(' ', 1)
+    cells = [b'<tr class="' +
+             (b'italic_text partial_table' if partial else b'full_table') +
+             b'" ><th scope="row" class="right " data-stat="ranker" csk="' +
+             str(rank).encode() + b'" >' + str(rank).encode() + b'</th>',
+             b'<td class="left " data-stat="player" csk="' +
+             (last + ',' + first).encode() + b'" ><a href="/players/' +
+             last[0].lower().encode() + b'/' + nba_slug(name).encode() +
+             b'">' + name.encode() + b'</a></td>',
+             b'<td class="center " data-stat="pos" >SF</td>']
+    for stat, column in SEASON_STAT_FIELDS.items():
+        value = b'' if np.isnan(stats[column]) else \
+            str(int(stats[column])).encode()
+        cells.append(b'<td class="right " data-stat="' + stat + b'" >' +
+                     value + b'</td>')
+    return b''.join(cells) + b'</tr>'
+
+
+def college_page(name, stats):
+    """
+    Returns a college player page (bytes) with the given career stats
+    (dict of COLLEGE_STAT_FIELDS fields to strings) in the pullout.
+    """
+    lines = [b'<div class="stats_pullout"><div class="p1">']
+    for header, field in COLLEGE_STAT_FIELDS.items():
+        lines.append(b'<div><span class="poptip" data-tip="' +
+                     field.encode() + b'"><strong>' + header +
+                     b'</strong></span>')
+        lines.append(b'<p>' + stats[field].encode() + b'</p></div>')
+    lines.append(b'</div></div>')
+    return page(name + ' College Stats', lines)
+
+
+def synthesize_site(players=500, seed=163, last_year=None):
+    """
+    Takes a number of nba players, a random seed, and the last season
+    (the one in progress by default). Generates a site where every player
+    has an nba career of random length and random season stats (some are
+    traded mid-season), and most have a college page, along with college
+    players who never made the nba. Returns a dict of page paths to bodies
+    (bytes), and the site's ground truth: a dict with the season rows
+    ('names', 'years' & 'stats', like build_season_table takes) and the
+    college stats of every nba player with a college page ('college').
+    """
+    rng = np.random.default_rng(seed)
+    last_year = last_year or current_season()
+    names = player_names(players + players // 4, rng)
+    nba, college_only = names[:players], names[players:]
+
+    truth = {'names': [], 'years': [],
+             'stats': {column: [] for column in SEASON_STAT_FIELDS.values()},
+             'college': {}}
+    seasons = {year: [] for year in range(FIRST_YEAR, last_year + 1)}
+    for name in nba:
+        start = int(rng.integers(FIRST_YEAR, last_year + 1))
+        for year in range(start, min(last_year, start +
+                                     int(rng.integers(1, 16)) - 1) + 1):
+            stats = {column: float(rng.integers(1, 2500))
+                     for column in SEASON_STAT_FIELDS.values()}
+            if year < BLOCKS_STEALS_YEAR:
+                stats['steals'] = stats['blocks'] = np.nan
+            seasons[year].append((name, stats, rng.random() < 0.05))
+            truth['names'].append(name)
+            truth['years'].append(year)
+            for column, value in stats.items():
+                truth['stats'][column].append(value)
+
+    pages = {}
+    for year, rows in seasons.items():
+        lines = []
+        for rank, (name, stats, traded) in enumerate(rows, 1):
+            lines.append(season_row(rank, name, stats))
+            for team in range(2 if traded else 0):
+                lines.append(season_row(rank, name, {
+                    column: float(rng.integers(1, 1000))
+                    for column in stats}, partial=True))
+        pages['/leagues/NBA_' + str(year) + '_totals.html'] = \
+            page(str(year) + ' NBA Player Totals', lines)
+
+    with_college = [name for name in nba if rng.random() < 0.9]
+    for name in with_college + college_only:
+        stats = {field: str(round(float(rng.uniform(0, 40)), 1))
+                 for field in COLLEGE_STAT_FIELDS.values()}
+        pages['/cbb/players' + cbb_slug(name)] = college_page(name, stats)
+        if name in nba:
+            truth['college'][name] = stats
+
+    for letter in string.ascii_lowercase:
+        pages['/players/' + letter + '/'] = page(
+            'Players ' + letter.upper(),
+            [b'<tr><th scope="row" class="left " data-stat="player" >'
+             b'<a href="/players/' + letter.encode() + b'/' +
+             nba_slug(name).encode() + b'">' + name.encode() + b'</a></th>'
+             b'</tr>' for name in sorted(nba)
+             if name.split(' ', 1)[1][0].lower() == letter])
+        pages['/cbb/players/' + letter + '-index.html'] = page(
+            'College Players ' + letter.upper(),
+            [b'<p><a href="/cbb/players' + cbb_slug(name).encode() + b'">' +
+             name.encode() + b'</a></p>'
+             for name in sorted(with_college + college_only)
+             if name.split(' ', 1)[1][0].lower() == letter])
+
+    return pages, truth
+
+
+def expected_players(truth):
+    """
+    Takes the ground truth of a synthesized site, and returns the player
+    data (pandas df, formatted like 'player_data.npz', see
+    'player_table.py') a manual refresh of the site should produce.
+    """
+    from manual_utils import build_season_table, format_career_data
+    from player_table import format_player_table
+
+    careers = format_career_data(build_season_table(
+        truth['names'], truth['years'], truth['stats']))\
+        .rename(columns={'career_length': 'nba_career_length'})
+    return format_player_table(
+        careers.join(pd.DataFrame.from_dict(truth['college'],
+                                            orient='index'), how='inner')
+        .rename_axis('name').reset_index())
+
+
+def archived_site(archive_path):
+    """
+    Takes the path of a page archive and returns a dict of page paths to
+    the latest archived bodies, to serve the pages of a recorded refresh.
+    """
+    from page_archive import open_archive
+
+    archive = open_archive(archive_path)
+    pages = {urlsplit(url).path: archive.read(archive.latest(url)['digest'])
+             for url in archive.urls()}
+    archive.close()
+    return pages
+
+
+class MockSite:
+    """
+    A local HTTP server for a dict of page paths to bodies. Every response
+    is delayed by latency seconds plus a random (exponential) jitter, a
+    share of requests (error_rate) fail with a 500, and with max_rate set
+    (requests per second), requests over that rate are throttled with a
+    429 and a Retry-After header. Unknown pages are 404s, and ETags make
+    conditional requests work. Counts of every status, bytes sent and the
+    latency added are kept in 'stats'.
+    """
+
+    def __init__(self, pages, latency=0.0, jitter=0.0, error_rate=0.0,
+                 max_rate=None, retry_after=1, seed=None,
+                 host='127.0.0.1', port=0):
+        self.pages = pages
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.max_rate = max_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.tokens = max(1.0, max_rate or 0)
+        self.refilled = time.monotonic()
+        self.stats = {'requests': 0, 'bytes': 0, 'delay_seconds': 0.0,
+                      'status': {}}
+        self.httpd = ThreadingHTTPServer((host, port), self.handler())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        """
+        Returns the base URL of the site, e.g. 'http://127.0.0.1:8000'.
+        """
+        host, port = self.httpd.server_address[:2]
+        return 'http://' + host + ':' + str(port)
+
+    def take_token(self):
+        """
+        Returns whether a request is allowed under max_rate (token bucket,
+        with a burst of one second's worth of requests).
+        """
+        if not self.max_rate:
+            return True
+        now = time.monotonic()
+        self.tokens = min(max(1.0, self.max_rate), self.tokens +
+                          (now - self.refilled) * self.max_rate)
+        self.refilled = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def respond(self, path, etag):
+        """
+        Takes a request path and its If-None-Match header, and returns the
+        status, headers (dict) and body of the response, and the seconds
+        to delay it by.
+        """
+        with self.lock:
+            delay = self.latency + (self.random.expovariate(1 / self.jitter)
+                                    if self.jitter else 0)
+            failed = self.random.random() < self.error_rate
+            allowed = self.take_token()
+
+        body = self.pages.get(path)
+        if not allowed:
+            return 429, {'Retry-After': str(self.retry_after)}, b'', delay
+        if failed:
+            return 500, {}, b'', delay
+        if body is None:
+            return 404, {}, b'', delay
+
+        digest = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        if etag == digest:
+            return 304, {'ETag': digest}, b'', delay
+        return 200, {'ETag': digest, 'Content-Type': 'text/html'}, body, delay
+
+    def handler(self):
+        """
+        Returns the request handler class of the server.
+        """
+        site = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                status, headers, body, delay = site.respond(
+                    urlsplit(self.path).path,
+                    self.headers.get('If-None-Match'))
+                time.sleep(delay)
+
+                self.send_response(status)
+                for header, value in headers.items():
+                    self.send_header(header, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+                with site.lock:
+                    site.stats['requests'] += 1
+                    site.stats['bytes'] += len(body)
+                    site.stats['delay_seconds'] += delay
+                    site.stats['status'][status] = \
+                        site.stats['status'].get(status, 0) + 1
+
+            def log_message(self, format, *args):
+                pass
+
+        return RequestHandler
+
+    def start(self):
+        """
+        Starts serving on a background thread, and returns the site.
+        """
+        self.thread = threading.Thread(target=self.httpd.serve_forever,
+                                       daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stops serving and closes the server.
+        """
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def add_site_arguments(parser):
+    """
+    Adds the arguments that pick & shape the mock site (shared with
+    'load_test.py') to an argparse parser.
+    """
+    parser.add_argument('--players', type=int, default=500,
+                        help='nba players on the synthesized site')
+    parser.add_argument('--seed', type=int, default=163,
+                        help='random seed of the synthesized site and of \
+                             the errors')
+    parser.add_argument('--archive', metavar='DIR', default=None,
+                        help='serve the pages recorded in this page \
+                             archive (e.g. data/archive) instead')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds every response is delayed')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='mean of a random (exponential) extra delay, \
+                             in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='share of requests that fail with a 500')
+    parser.add_argument('--max-rate', type=float, default=None,
+                        help='requests per second served before throttling \
+                             with 429s')
+    parser.add_argument('--retry-after', type=int, default=1,
+                        help='Retry-After seconds sent with 429s')
+
+
+def build_site(args):
+    """
+    Takes parsed site arguments (see add_site_arguments) and returns the
+    pages to serve, and the ground truth (None for recorded pages).
+    """
+    if args.archive:
+        return archived_site(args.archive), None
+    return synthesize_site(args.players, args.seed)
+
+
+def main():
+    """
+    Serves a mock site until interrupted.
+    """
+    parser = argparse.ArgumentParser(description='Serve a local stand-in \
+                                                 for the scraped sites')
+    parser.add_argument('--port', type=int, default=8000)
+    add_site_arguments(parser)
+    args = parser.parse_args()
+
+    pages, truth = build_site(args)
+    site = MockSite(pages, args.latency, args.jitter, args.error_rate,
+                    args.max_rate, args.retry_after, args.seed,
+                    port=args.port)
+    print('serving ' + str(len(pages)) + ' pages on ' + site.url +
+          ' (nba pages at ' + site.url + ', college pages at ' + site.url +
+          '/cbb)')
+    try:
+        site.httpd.serve_forever()
+    except KeyboardInterrupt:
+        site.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Corey Zarkowski, Bryan Phan, Lawrence Lorbiecki -- CSE 163
+Disk cache for trained models, used in 'player_predictor.py'. Each model is
+saved with its hyperparameters under a key hashed from its training data,
+its columns and its parameters, and is reloaded as long as the key still
+matches, so models are only retrained when the data or params change.
+Next to each model, an export of it (see 'forest_model.py') is saved, and
+models are loaded from their export, without sklearn.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+from importlib.metadata import version
+import pandas as pd
+import metrics
+from forest_model import export_forest, load_forest
+
+MODEL_DIR = os.path.join('data', 'models')
+
+
+def model_key(name, data, columns, params):
+    """
+    Takes a model name, its dataset (pandas df), the columns it trains on
+    (features then labels), and its hyperparameters (dict). Returns a key
+    (string) that changes if the training slice of the data (those columns,
+    minus rows with missing values), the columns or the params change.
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps({
+        'name': name,
+        'columns': columns,
+        'params': params,
+        'sklearn': version('scikit-learn')
+    }, sort_keys=True).encode())
+    digest.update(pd.util.hash_pandas_object(data[columns].dropna(),
+                                             index=False).values.tobytes())
+
+    return name + '-' + digest.hexdigest()[:20]
+
+
+def cached_model(name, data, columns, params, train):
+    """
+    Takes a model name, its dataset, columns & params (see model_key), and a
+    function that trains the model. Returns the exported model (a
+    ForestModel) saved under the matching key in MODEL_DIR, or trains,
+    saves & exports the model if there's no such model (replacing older
+    models with that name). A saved model that wasn't exported yet is
+    exported first.
+    """
+    model_dir = os.path.join(os.getcwd(), MODEL_DIR)
+    key = model_key(name, data, columns, params)
+    path = os.path.join(model_dir, key + '.joblib')
+    forest_path = os.path.join(model_dir, key + '.forest')
+
+    if os.path.exists(forest_path):
+        metrics.count('model_cache.hits')
+        return load_forest(forest_path)
+
+    import joblib
+
+    if os.path.exists(path):
+        metrics.count('model_cache.hits')
+        export_forest(joblib.load(path)['model'], forest_path)
+        return load_forest(forest_path)
+
+    metrics.count('model_cache.misses')
+    print('training ' + name + ' model...')
+    model = train()
+
+    os.makedirs(model_dir, exist_ok=True)
+    for old in os.listdir(model_dir):
+        if old.startswith(name + '-'):
+            old_path = os.path.join(model_dir, old)
+            if os.path.isdir(old_path):
+                shutil.rmtree(old_path)
+            else:
+                os.remove(old_path)
+
+    joblib.dump({'model': model, 'params': params, 'columns': columns},
+                path + '.tmp')
+    os.replace(path + '.tmp', path)
+    export_forest(model, forest_path)
+
+    return load_forest(forest_path)
@@ -0,0 +1,177 @@
+"""
+Corey Zarkowski, Bryan Phan, Lawrence Lorbiecki -- CSE 163
+Fuzzy player name lookup, used in 'player_predictor.py'. Names are
+normalized (case, accents, punctuation) and split into character trigrams,
+and an inverted list of trigram -> names is built once and saved next to
+the data, so a misspelled name is matched without comparing it to every
+player.
+"""
+
+import os
+import re
+import unicodedata
+from difflib import SequenceMatcher
+import numpy as np
+import metrics
+
+NON_ALNUM = re.compile(r'[^a-z0-9 ]+')
+# number of trigram matches re-scored with SequenceMatcher per search
+SHORTLIST = 10
+
+
+def normalize_name(name):
+    """
+    Takes a player name and returns it lowercased, without accents or
+    punctuation, and with single spaces. Names in the scraped data are
+    stored the way str() prints bytes (e.g. "D\\'Angelo", "Estim\\xe9"), so
+    those escapes are undone first.
+    """
+    if '\\' in name:
+        try:
+            raw = name.encode('latin-1').decode('unicode_escape')\
+                .encode('latin-1')
+            try:
+                name = raw.decode('utf-8')
+            except UnicodeDecodeError:
+                name = raw.decode('latin-1')
+        except UnicodeError:
+            pass
+
+    name = unicodedata.normalize('NFKD', name)
+    name = ''.join(char for char in name if not unicodedata.combining(char))
+    name = NON_ALNUM.sub('', name.lower())
+
+    return ' '.join(name.split())
+
+
+def name_grams(name):
+    """
+    Takes a normalized name and returns its distinct character trigrams,
+    with the name padded by a space on each side.
+    """
+    padded = ' ' + name + ' '
+    return sorted({padded[i:i + 3] for i in range(len(padded) - 2)})
+
+
+def build_name_index(names):
+    """
+    Takes an iterable of player names and returns a name index: a dict of
+    numpy arrays holding the names (one utf-8 blob plus offsets), the
+    sorted trigrams, and for each trigram the ids of the names containing
+    it.
+    """
+    names = list(names)
+    encoded = [name.encode('utf-8') for name in names]
+    name_offsets = np.zeros(len(names) + 1, dtype=np.int64)
+    name_offsets[1:] = np.cumsum([len(name) for name in encoded])
+    postings = {}
+    gram_counts = np.zeros(len(names), dtype=np.int16)
+
+    for name_id, name in enumerate(names):
+        grams = name_grams(normalize_name(name))
+        gram_counts[name_id] = len(grams)
+        for gram in grams:
+            postings.setdefault(gram, []).append(name_id)
+
+    grams = sorted(postings)
+    offsets = np.zeros(len(grams) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(postings[gram]) for gram in grams])
+
+    return {
+        'name_bytes': np.frombuffer(b''.join(encoded), dtype=np.uint8),
+        'name_offsets': name_offsets,
+        'grams': np.array(grams, dtype=str),
+        'offsets': offsets,
+        'postings': np.fromiter((name_id for gram in grams
+                                 for name_id in postings[gram]),
+                                dtype=np.int32, count=offsets[-1]),
+        'gram_counts': gram_counts
+    }
+
+
+def source_stamp(path):
+    """
+    Returns a stamp (size and modification time) for the file an index was
+    built from, so a saved index can tell when it's out of date.
+    """
+    stat = os.stat(path)
+    return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+
+def save_name_index(index, path, source_path):
+    """
+    Takes a name index and writes it to an .npz file at the given path,
+    stamped with the file the names came from.
+    """
+    np.savez(path, source=source_stamp(source_path), **index)
+
+
+def load_name_index(path, source_path, names=None):
+    """
+    Loads the name index saved at path. If it's missing or the names file
+    at source_path changed since it was saved, the index is rebuilt from
+    names (an iterable, or a callable returning one) and saved again.
+    Returns the name index.
+    """
+    if os.path.exists(path):
+        with np.load(path) as saved:
+            if np.array_equal(saved['source'], source_stamp(source_path)):
+                metrics.count('name_index.hits')
+                return {key: saved[key] for key in saved.files
+                        if key != 'source'}
+
+    metrics.count('name_index.misses')
+    print('building name index...')
+    index = build_name_index(names() if callable(names) else names)
+    save_name_index(index, path, source_path)
+    return index
+
+
+def search_name_index(index, name, k=5):
+    """
+    Takes a name index, a player name, and a count k. Returns up to k
+    (name, score) tuples for the indexed names most similar to the given
+    one, best first. Candidates are the names sharing the most trigrams
+    with it (Dice coefficient), and the best SHORTLIST of those are scored
+    by SequenceMatcher ratio on their normalized forms (1.0 for names that
+    normalize the same).
+    """
+    normalized = normalize_name(name)
+    grams = np.array(name_grams(normalized), dtype=str)
+    positions = np.searchsorted(index['grams'], grams)
+    found = positions < len(index['grams'])
+    found[found] = index['grams'][positions[found]] == grams[found]
+    positions = positions[found]
+    if len(positions) == 0:
+        return []
+
+    offsets = index['offsets']
+    matches = np.bincount(
+        np.concatenate([index['postings'][offsets[p]:offsets[p + 1]]
+                        for p in positions]),
+        minlength=len(index['gram_counts']))
+
+    candidates = np.flatnonzero(matches)
+    dice = 2 * matches[candidates] / \
+        (len(grams) + index['gram_counts'][candidates])
+    shortlist = max(k, SHORTLIST)
+    if len(candidates) > shortlist:
+        candidates = candidates[np.argpartition(-dice, shortlist - 1)
+                                [:shortlist]]
+
+    scored = []
+    matcher = SequenceMatcher(None, b=normalized)
+    for name_id in candidates:
+        other = index_name(index, name_id)
+        matcher.set_seq1(normalize_name(other))
+        scored.append((other, matcher.ratio()))
+
+    return sorted(scored, key=lambda match: -match[1])[:k]
+
+
+def index_name(index, name_id):
+    """
+    Takes a name index and a name id, and returns that name.
+    """
+    start, end = index['name_offsets'][name_id:name_id + 2]
+    return index['name_bytes'][start:end].tobytes().decode('utf-8')
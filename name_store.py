@@ -0,0 +1,107 @@
+"""
+Corey Zarkowski, Bryan Phan, Lawrence Lorbiecki -- CSE 163
+On-disk store of college player names -> sports-reference URLs, used in
+place of loading all of 'college_players.json' into memory. The store is
+an SQLite table keyed (and clustered) by name, opened read-only and
+memory-mapped, so exact lookups, prefix lookups and iteration only touch
+the pages they need, and startup doesn't depend on how many players there
+are.
+"""
+
+import os
+import sqlite3
+from collections.abc import Mapping
+
+# bytes of the store file SQLite may memory-map
+MMAP_SIZE = 256 * 1024 * 1024
+
+
+class NameStore(Mapping):
+    """
+    Read-only dict-like view of a name store file: supports 'name in
+    store', store[name], len(store), and lazy iteration over names (in
+    sorted order), plus prefix lookups.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect('file:' + path + '?mode=ro', uri=True,
+                                  check_same_thread=False)
+        self.db.execute('PRAGMA mmap_size = ' + str(MMAP_SIZE))
+
+    def __getitem__(self, name):
+        row = self.db.execute('SELECT url FROM players WHERE name = ?',
+                              (name,)).fetchone()
+        if row is None:
+            raise KeyError(name)
+        return row[0]
+
+    def __contains__(self, name):
+        return self.db.execute('SELECT 1 FROM players WHERE name = ?',
+                               (name,)).fetchone() is not None
+
+    def __iter__(self):
+        for row in self.db.execute('SELECT name FROM players ORDER BY name'):
+            yield row[0]
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM players').fetchone()[0]
+
+    def prefix(self, prefix, limit=-1):
+        """
+        Takes a name prefix (case sensitive) and an optional max count, and
+        yields the (name, url) tuples of players whose names start with it,
+        in sorted order.
+        """
+        yield from self.db.execute(
+            'SELECT name, url FROM players WHERE name >= ? AND name < ? '
+            'ORDER BY name LIMIT ?', (prefix, prefix + '\uffff', limit))
+
+    def close(self):
+        """
+        Closes the store file.
+        """
+        self.db.close()
+
+
+def open_name_store(path):
+    """
+    Takes the path of a name store file and returns a NameStore for it.
+    """
+    return NameStore(path)
+
+
+def write_name_store(path, players):
+    """
+    Takes a path and a dict (or iterable of (name, url) tuples) of college
+    players/urls, and writes a new name store file there. The file is built
+    next to the target and swapped in at the end, so readers never see a
+    half-written store.
+    """
+    items = players.items() if isinstance(players, Mapping) else players
+    tmp_path = path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    db = sqlite3.connect(tmp_path)
+    db.execute('CREATE TABLE players (name TEXT PRIMARY KEY, '
+               'url TEXT NOT NULL) WITHOUT ROWID')
+    db.executemany('INSERT OR REPLACE INTO players VALUES (?, ?)', items)
+    db.commit()
+    db.execute('VACUUM')
+    db.close()
+
+    os.replace(tmp_path, path)
+
+
+def update_name_store(path, players):
+    """
+    Takes the path of an existing name store file and a dict of college
+    players/urls, and adds those players to it (replacing the urls of any
+    already in it).
+    """
+    db = sqlite3.connect(path)
+    db.executemany('INSERT OR REPLACE INTO players VALUES (?, ?)',
+                   players.items())
+    db.commit()
+    db.close()
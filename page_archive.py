@@ -0,0 +1,171 @@
+"""
+Corey Zarkowski, Bryan Phan, Lawrence Lorbiecki -- CSE 163
+Archive of raw scraped pages, used by 'scrape_utils.py'. Every page body
+is stored gzipped under its sha256 (so a page that didn't change is only
+stored once), and an SQLite index records every fetch of a URL: when it
+happened, the hash of the body, and the ETag/Last-Modified headers to make
+the next request for it conditional. 'player_predictor.py --reparse'
+rebuilds the data by parsing the archived pages, without the network.
+"""
+
+import gzip
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+import metrics
+
+COMPRESS_LEVEL = 6
+# pages handed to a parsing process at a time
+PARSE_CHUNK = 16
+
+
+class PageArchive:
+    """
+    A page archive directory: an 'index.db' of fetches, and the page bodies
+    in 'objects'. Safe to share between fetching threads.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.join(path, 'objects'), exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(path, 'index.db'),
+                                  check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode = WAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS fetches ('
+                        'url TEXT NOT NULL, fetched_at REAL NOT NULL, '
+                        'digest TEXT NOT NULL, etag TEXT, '
+                        'last_modified TEXT, '
+                        'PRIMARY KEY (url, fetched_at)) WITHOUT ROWID')
+
+    def latest(self, url):
+        """
+        Takes a URL and returns a dict with the 'fetched_at' time, body
+        'digest', 'etag' and 'last_modified' of its latest fetch, or None
+        if it was never archived.
+        """
+        with self.lock:
+            row = self.db.execute(
+                'SELECT fetched_at, digest, etag, last_modified FROM '
+                'fetches WHERE url = ? ORDER BY fetched_at DESC LIMIT 1',
+                (url,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(['fetched_at', 'digest', 'etag', 'last_modified'],
+                        row))
+
+    def urls(self):
+        """
+        Returns a list of every archived URL, in sorted order.
+        """
+        with self.lock:
+            return [row[0] for row in self.db.execute(
+                'SELECT DISTINCT url FROM fetches ORDER BY url')]
+
+    def read(self, digest):
+        """
+        Takes a body digest and returns the archived page body (bytes).
+        """
+        return read_object(self.path, digest)
+
+    def store(self, url, body, etag=None, last_modified=None):
+        """
+        Takes a URL, the page body fetched from it (bytes), and the page's
+        ETag & Last-Modified headers (if any). Stores the body (unless an
+        identical one already is) and records the fetch. Returns the body
+        digest.
+        """
+        digest = hashlib.sha256(body).hexdigest()
+        path = object_path(self.path, digest)
+
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = path + '.' + str(threading.get_ident()) + '.tmp'
+            with open(tmp_path, 'wb') as outfile:
+                outfile.write(gzip.compress(body, COMPRESS_LEVEL))
+            os.replace(tmp_path, path)
+
+        self.record(url, digest, etag, last_modified)
+        return digest
+
+    def record(self, url, digest, etag=None, last_modified=None):
+        """
+        Records a fetch of a URL that returned the archived body with the
+        given digest, e.g. when a conditional request said it's unchanged.
+        """
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO fetches VALUES '
+                            '(?, ?, ?, ?, ?)', (url, time.time(), digest,
+                                                etag, last_modified))
+            self.db.commit()
+
+    def close(self):
+        """
+        Closes the archive index.
+        """
+        self.db.close()
+
+
+def open_archive(path):
+    """
+    Takes the path of a page archive directory (created if missing) and
+    returns a PageArchive for it.
+    """
+    return PageArchive(path)
+
+
+def object_path(archive_path, digest):
+    """
+    Returns the path of the archived body with the given digest.
+    """
+    return os.path.join(archive_path, 'objects', digest[:2],
+                        digest[2:] + '.gz')
+
+
+def read_object(archive_path, digest):
+    """
+    Takes the path of a page archive and a body digest, and returns the
+    archived page body (bytes).
+    """
+    with open(object_path(archive_path, digest), 'rb') as infile:
+        return gzip.decompress(infile.read())
+
+
+def _parse_object(archive_path, digest, parse):
+    """
+    Reads an archived body and returns parse(body). Runs in a parsing
+    process. Missing pages (no digest) are parsed as empty.
+    """
+    return parse(read_object(archive_path, digest) if digest else b'')
+
+
+def parse_archived(archive, pages, workers=None):
+    """
+    Takes a PageArchive, an iterable of (url, parse function) tuples, and a
+    process count (None for one per core). Reads the latest archived body
+    of every URL and parses it on a process pool, and yields (url, parsed
+    page) tuples in the same order as the input. URLs that aren't in the
+    archive are parsed as empty pages, and counted in a warning.
+    """
+    pages = list(pages)
+    digests = []
+    for url, parse in pages:
+        record = archive.latest(url)
+        digests.append(record['digest'] if record else None)
+
+    missing = digests.count(None)
+    metrics.count('archive.hits', len(pages) - missing)
+    metrics.count('archive.misses', missing)
+    if missing:
+        print('warning: ' + str(missing) + ' of ' + str(len(pages)) +
+              ' pages are not in the page archive')
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from zip([url for url, parse in pages],
+                       pool.map(_parse_object,
+                                [archive.path] * len(pages), digests,
+                                [parse for url, parse in pages],
+                                chunksize=PARSE_CHUNK))
@@ -3,35 +3,68 @@ Corey Zarkowski, Bryan Phan, Lawrence Lorbiecki -- CSE 163
 This file contains primary methods for predicting a college basketball
 player's future NBA career based off their college stats. More detail can
 be found in function headers.
+
+Only light modules are imported up front. The scraper, pandas, sklearn,
+the model cache and the name index are imported inside the functions
+that use them, so a run only pays for the parts it needs (see
+--startup-profile).
 """
 
+from profile_utils import StartupProfile
+import metrics
+import atexit
 import os
-import requests
-import pandas as pd
+import numpy as np
 import argparse
 import json
-import ssl
-from difflib import SequenceMatcher
-from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
-from sklearn.metrics import accuracy_score, mean_squared_error
-from manual_utils import fetch_cbb_player_URLs, fetch_college_data,\
-                         fetch_college_player_data,\
-                         fetch_nba_player_URLs, format_career_data,\
-                         fetch_nba_career_data
+import sys
+import shutil
+import string
+from datetime import date
+from batch_utils import read_prospects, write_results
+from name_store import open_name_store, update_name_store, write_name_store
 
 URL_CSV = 'https://gist.githubusercontent.com/corinzarkowski/4d1e66a9253b552ee95d62dbf74b3185/raw/579c5421fae54680435ca33e104c254c74638af1/cbb_nba_data.csv'
 URL_JSON = 'https://gist.githubusercontent.com/corinzarkowski/f6bee01b354419c4095e55173d52873b/raw/8541672e08f7f1f00dd8ef4440b7742f87357c33/cbb_names_urls.json'
+# files synced by init_data_gist (see 'gist_sync.py'). Both raw URLs are
+# pinned to a gist commit, so they're immutable: the sha256 of the first
+# download is pinned, and a download that doesn't match it is rejected
+GIST_ARTIFACTS = {'player_data': {'url': URL_CSV, 'immutable': True},
+                  'college_players': {'url': URL_JSON, 'immutable': True}}
+# college stats the models predict from, and what they predict
+FEATURES = ['Points', 'Assists', 'Rebounds', 'FGP']
+CAREER_LABELS = ['best_year', 'nba_career_length']
+ALLSTAR_LABELS = ['allstar']
+# forest size & depth of the models used for predictions
+MODEL_ESTIMATORS = 100
+MODEL_DEPTH = None
+# threads forests are built on (-1 for one per core)
+TRAIN_JOBS = -1
+# forest sizes & depths tried by --test-models
+TEST_ESTIMATORS = [50, 100, 200, 400]
+TEST_DEPTHS = [5, 10, 15, 20, 30, 40, None]
+# fields predict_players adds to a player's dict
+PREDICTION_FIELDS = ['projected_career_length', 'projected_prime',
+                     'allstar', 'allstar_probability', 'comparables',
+                     'error']
+# prospects resolved, fetched & predicted together in --batch mode
+BATCH_SIZE = 500
+# lowest name index score a name is resolved to without asking the user
+MIN_MATCH_SCORE = 0.6
+# days stored college stats of players still in college stay fresh
+COLLEGE_TTL_DAYS = 1
 
 
 def process_args():
     """
-    This file parses command line arguments and returns them formatted nicely.
-    Documentation for the arguments can be seen with the '-h' argument.
+    This file parses command line arguments and returns them formatted nicely
+    (as an argparse namespace). Documentation for the arguments can be seen
+    with the '-h' argument.
     """
     parser = argparse.ArgumentParser(description='Take college basketball \
                                                  players and return career \
                                                  predictions')
-    parser.add_argument('players', metavar='P', type=str, nargs='+',
+    parser.add_argument('players', metavar='P', type=str, nargs='*',
                         help='Player(s) to predict. input \
                              in \'player1\' \'player2\' \
                              \'player3\' format')
@@ -48,16 +81,86 @@ def process_args():
                         const=True, default=False,
                         help='Option to refresh player data \
                              from pre-existing gist pages (default)')
+    parser.add_argument('--incremental', dest='is_incremental',
+                        action='store_const',
+                        const=True, default=False,
+                        help='Option to make --reload-manual only \
+                             scrape seasons that may have changed \
+                             and college pages of new players, \
+                             merging them into the existing data')
+    parser.add_argument('--resume', dest='do_resume',
+                        action='store_const',
+                        const=True, default=False,
+                        help='Option to carry on with an interrupted \
+                             --reload-manual from its last checkpoint \
+                             instead of starting over')
+    parser.add_argument('--reparse', dest='do_reparse',
+                        action='store_const',
+                        const=True, default=False,
+                        help='Option to rebuild player data from the \
+                             pages archived by earlier manual refreshes, \
+                             without the network (e.g. after changing \
+                             what gets parsed from them)')
+    parser.add_argument('--no-prompt', dest='no_prompt',
+                        action='store_const',
+                        const=True, default=False,
+                        help='Option to resolve unrecognized player \
+                             names to their closest match without \
+                             asking (skipping poor matches)')
+    parser.add_argument('--college-ttl', dest='college_ttl',
+                        metavar='DAYS', type=float,
+                        default=COLLEGE_TTL_DAYS,
+                        help='Days the stored college stats of players \
+                             still in college are used before being \
+                             fetched again (stats of players whose \
+                             college careers are over never expire)')
     parser.add_argument('--test-models', dest='is_test',
                         action='store_const',
                         const=True, default=False,
                         help='Option to test models with depth \
                              and tree counts for random forest')
 
+    parser.add_argument('--jobs', dest='jobs', metavar='N', type=int,
+                        default=TRAIN_JOBS,
+                        help='Number of threads models are trained on \
+                             (processes for --test-models), -1 for one \
+                             per core (default)')
+
+    parser.add_argument('--batch', dest='batch', metavar='FILE',
+                        default=None,
+                        help='Option to predict every prospect in a \
+                             csv or JSON-lines file of names and/or \
+                             college stats (implies --no-prompt)')
+    parser.add_argument('--output', dest='output', metavar='FILE',
+                        default='predictions.jsonl',
+                        help='File --batch predictions are written to, \
+                             as csv or JSON lines depending on the \
+                             extension (\'-\' for stdout)')
+
+    parser.add_argument('--serve', dest='serve', metavar='MODE',
+                        default=None,
+                        help='Option to keep data & models loaded and \
+                             answer JSON requests, over stdin/stdout \
+                             (\'stdio\') or local HTTP (a port number)')
+
+    parser.add_argument('--metrics', dest='metrics', metavar='FILE',
+                        default=None,
+                        help='File to append pipeline metrics to as JSON \
+                             lines (stage times, requests, bytes, \
+                             retries, cache hits, rows parsed/dropped), \
+                             with a summary printed at the end')
+    parser.add_argument('--startup-profile', dest='startup_profile',
+                        action='store_const',
+                        const=True, default=False,
+                        help='Option to print how long each phase of \
+                             the run took, and how much of it was \
+                             spent importing modules (to stderr)')
+
     args = parser.parse_args()
+    if not args.players and not args.batch and not args.serve:
+        parser.error('at least one player (or --batch/--serve) is required')
 
-    return args.do_refresh_man, args.do_refresh_gist, \
-        args.players, args.is_test
+    return args
 
 
 def data_loaded():
@@ -65,162 +168,690 @@ def data_loaded():
     Checks to see if the nba datafile & college datafile are loaded. If
     anything is unloaded, returns False, else True.
     """
-    return os.path.exists(os.path.join(os.getcwd(),
-                          'data', 'player_data.csv'))\
+    return (os.path.exists(os.path.join(os.getcwd(),
+                           'data', 'player_data.npz'))
+            or os.path.exists(os.path.join(os.getcwd(),
+                              'data', 'player_data.csv')))\
         and os.path.exists(os.path.join(os.getcwd(), 'data',
-                                        'college_players.json'))
+                                        'college_players.db'))
+
+
+def load_player_data():
+    """
+    Returns the nba/college player data (pandas df, see 'player_table.py'),
+    from the typed 'player_data.npz' table. If the table is missing or
+    'player_data.csv' was replaced since it was saved, it's rebuilt from
+    the csv first.
+    """
+    import pandas as pd
+    from player_table import format_player_table, load_player_table,\
+        save_player_table
+
+    table_path = os.path.join(os.getcwd(), 'data', 'player_data.npz')
+    csv_path = os.path.join(os.getcwd(), 'data', 'player_data.csv')
+
+    player_df = load_player_table(table_path, csv_path)
+    metrics.count('player_table.hits' if player_df is not None
+                  else 'player_table.misses')
+    if player_df is None:
+        print('building player table...')
+        player_df = format_player_table(pd.read_csv(csv_path))
+        save_player_table(player_df, table_path, csv_path)
+    return player_df
+
+
+def save_player_data(player_df, suffix=''):
+    """
+    Takes a dataframe of nba/college player data and writes it to the
+    typed 'player_data.npz' table, and to 'player_data.csv' as an export.
+    With a suffix, the files are written under their names plus the suffix
+    instead, to be moved into place later.
+    """
+    from player_table import format_player_table, save_player_table
+
+    table_path = os.path.join(os.getcwd(), 'data', 'player_data.npz') + suffix
+    csv_path = os.path.join(os.getcwd(), 'data', 'player_data.csv') + suffix
+
+    player_df = format_player_table(player_df)
+    player_df.to_csv(csv_path, index=False)
+    save_player_table(player_df, table_path, csv_path)
 
 
-def init_data_manual():
+def open_page_archive():
+    """
+    Opens the 'archive' page archive (see 'page_archive.py') and makes the
+    scraper store every page it fetches in it and request archived pages
+    conditionally. Returns the archive, which the rest of the run shares.
+    """
+    from page_archive import open_archive
+    from scrape_utils import use_archive
+
+    archive = open_archive(os.path.join(os.getcwd(), 'data', 'archive'))
+    use_archive(archive)
+    return archive
+
+
+def open_stats_store(ttl_days=COLLEGE_TTL_DAYS):
+    """
+    Opens the 'college_stats.db' store (see 'college_store.py') and makes
+    college stats lookups go through it, so stats fetched before are read
+    from disk until they expire after ttl_days (if the player is still in
+    college). Returns the store, which the rest of the run shares.
+    """
+    from college_store import open_college_store
+    from manual_utils import use_college_store
+
+    store = open_college_store(os.path.join(os.getcwd(), 'data',
+                                            'college_stats.db'))
+    use_college_store(store, ttl_days * 24 * 60 * 60)
+    return store
+
+
+@metrics.stage('refresh_manual')
+def init_data_manual(save_state=True, resume=False, work_dir='refresh'):
     """
     Scrapes data on nba/college basketball players, formats it,
-    and then writes it to 'player_data.csv' and 'college_players.json'.
-    Uses functions from 'manual_utils.py'
+    and then writes it to 'player_data.npz' (see 'player_table.py', with
+    'player_data.csv' as an export) and the 'college_players.db' name
+    store (see 'name_store.py'). The raw season table is kept in
+    'season_stats.csv' for re-scoring, and the raw pages in the page
+    archive. The refresh state is saved unless save_state is False. Uses
+    functions from 'manual_utils.py'
+
+    Scraped records are written to the work_dir folder in 'data' as they
+    come in, with checkpoints (see 'refresh_utils.py'). With resume, an
+    interrupted refresh carries on from its last checkpoint.
     """
+    import pandas as pd
+    from manual_utils import format_career_data, save_season_table,\
+        current_season, season_closed
+    from refresh_utils import start_refresh, refresh_nba_players,\
+        refresh_cbb_players, refresh_seasons, refresh_college_data
+
     print('initializing data...')
     if not os.path.exists(os.path.join(os.getcwd(), 'data')):
         os.mkdir(os.path.join(os.getcwd(), 'data'))
 
-    player_urls_nba = fetch_nba_player_URLs()
-    player_urls_cbb = fetch_cbb_player_URLs()
-    player_data_unformatted = fetch_nba_career_data(player_urls_nba)
-    player_data = format_career_data(player_data_unformatted)
-    player_data_final = fetch_college_data(player_urls_cbb, player_data)
-
-    player_list = []
-    for player in player_data_final.keys():
-        player_list.append({
-                'name': player,
-                **player_data_final[player]
+    work_dir = os.path.join(os.getcwd(), 'data', work_dir)
+    checkpoint = start_refresh(work_dir, 1950, current_season(), resume)
+    last_year = checkpoint['last_year']
+
+    player_urls_nba = refresh_nba_players(work_dir, checkpoint)
+    store_path = refresh_cbb_players(work_dir, checkpoint)
+    season_table = refresh_seasons(work_dir, checkpoint, player_urls_nba)
+    save_season_table(season_table, os.path.join(os.getcwd(), 'data',
+                                                 'season_stats.csv'))
+    careers = format_career_data(season_table)
+    player_urls_cbb = open_name_store(store_path)
+    college_data = refresh_college_data(work_dir, player_urls_cbb,
+                                        careers.index)
+    player_urls_cbb.close()
+
+    player_df = careers.rename(columns={'career_length':
+                                        'nba_career_length'})\
+        .join(pd.DataFrame.from_dict(college_data, orient='index'),
+              how='inner')\
+        .rename_axis('name').reset_index()
+    save_player_data(player_df)
+    os.replace(store_path, os.path.join(os.getcwd(), 'data',
+                                        'college_players.db'))
+
+    if save_state:
+        fetched_on = date.fromisoformat(checkpoint['started'])
+        save_refresh_state({
+            'closed_seasons': [year for year in range(1950, last_year + 1)
+                               if season_closed(year, fetched_on)],
+            'college_checked': list(careers.index)
         })
+    shutil.rmtree(work_dir)
+
+
+@metrics.stage('reparse')
+def init_data_reparse(archive):
+    """
+    Takes the open page archive kept by earlier manual refreshes, and
+    rebuilds the same files as init_data_manual from it, without the
+    network: the latest copy of every page is read from the archive and
+    parsed on a process pool. The refresh state is left alone, since it
+    describes when those pages were fetched.
+    """
+    from scrape_utils import use_archive
+
+    print('reparsing archived pages...')
+    use_archive(archive, offline=True)
+    try:
+        init_data_manual(save_state=False, work_dir='reparse')
+    finally:
+        use_archive(archive)
+
+
+def load_refresh_state():
+    """
+    Returns the record of what the last manual refresh stored in 'data'
+    (a dict with 'closed_seasons', seasons whose totals are final, and
+    'college_checked', players whose college pages were already looked
+    up), or None if there's no manual refresh to build on.
+    """
+    state_path = os.path.join(os.getcwd(), 'data', 'refresh_state.json')
+    if not os.path.exists(state_path) or not \
+       os.path.exists(os.path.join(os.getcwd(), 'data', 'season_stats.csv')):
+        return None
+
+    with open(state_path, 'r') as infile:
+        return json.load(infile)
 
-    player_df = pd.DataFrame(player_list)
-    player_df.to_csv(os.path.join(os.getcwd(), 'data', 'player_data.csv'))
 
-    with open(os.path.join(os.getcwd(), 'data', 'college_players.json'), 'w') \
+def save_refresh_state(state):
+    """
+    Takes a refresh state dict (see load_refresh_state) and writes it to
+    'refresh_state.json'.
+    """
+    with open(os.path.join(os.getcwd(), 'data', 'refresh_state.json'), 'w') \
          as outfile:
-        json.dump(player_urls_cbb, outfile)
+        json.dump(state, outfile)
 
 
+@metrics.stage('refresh_incremental')
+def init_data_incremental(today=None):
+    """
+    Refreshes the manually scraped data without starting over. Only seasons
+    that weren't over when they were last fetched are scraped again (the
+    season in progress always is), and college pages are only fetched for
+    players not looked up before. Season rows are kept for the players in
+    the nba player index, like init_data_manual does. The results are
+    merged into 'player_data.npz', 'college_players.db' and
+    'season_stats.csv'. Falls back to init_data_manual if there's no
+    earlier manual refresh to build on. Uses today's date unless another
+    date is given.
+    """
+    import pandas as pd
+    from manual_utils import fetch_cbb_player_URLs, fetch_college_data,\
+        format_career_data, fetch_nba_career_data, fetch_nba_player_URLs,\
+        index_letter, save_season_table, load_season_table, current_season,\
+        season_closed
+
+    state = load_refresh_state()
+    if state is None:
+        print('no earlier manual refresh found, doing a full one')
+        init_data_manual()
+        return
+
+    print('initializing data (incremental)...')
+    closed = set(state['closed_seasons'])
+    checked = set(state['college_checked'])
+    today = today or date.today()
+    last_year = current_season(today)
+    first_year = min((year for year in range(1950, last_year + 1)
+                      if year not in closed), default=last_year)
+
+    season_path = os.path.join(os.getcwd(), 'data', 'season_stats.csv')
+    store_path = os.path.join(os.getcwd(), 'data', 'college_players.db')
+
+    season_table = load_season_table(season_path)
+    new_seasons = fetch_nba_career_data(fetch_nba_player_URLs(),
+                                        first_year, last_year)
+    season_table = pd.concat([
+        season_table[season_table.index.get_level_values('year') <
+                     first_year],
+        new_seasons
+    ]).sort_index()
+    careers = format_career_data(season_table)\
+        .rename(columns={'career_length': 'nba_career_length'})
+
+    player_df = load_player_data()
+    updated = player_df['name'].isin(
+        careers.index.intersection(new_seasons.index.unique('name')))
+    for column in ['best_year', 'nba_career_length']:
+        player_df.loc[updated, column] = \
+            player_df.loc[updated, 'name'].map(careers[column])
+
+    player_urls_cbb = open_name_store(store_path)
+    known = checked.union(player_df['name'])
+    new_players = [player for player in careers.index
+                   if player not in known]
+    letters = {index_letter(player) for player in new_players
+               if player not in player_urls_cbb}
+    letters = sorted(letters.intersection(string.ascii_lowercase))
+    if letters:
+        update_name_store(store_path, fetch_cbb_player_URLs(letters))
+    college_data = fetch_college_data(player_urls_cbb, new_players)
+
+    new_rows = careers.join(pd.DataFrame.from_dict(college_data,
+                                                   orient='index'),
+                            how='inner').rename_axis('name').reset_index()
+    player_df = pd.concat([player_df, new_rows], ignore_index=True)
+    print(str(updated.sum()) + ' players updated, ' + str(len(new_rows)) +
+          ' players added')
+
+    player_urls_cbb.close()
+    save_player_data(player_df)
+    save_season_table(season_table, season_path)
+
+    closed.update(year for year in range(first_year, last_year + 1)
+                  if season_closed(year, today))
+    save_refresh_state({
+        'closed_seasons': sorted(closed),
+        'college_checked': sorted(checked.union(new_players))
+    })
+
+
+@metrics.stage('refresh_gist')
 def init_data_gist():
     """
-    Reads in nba/college datasets from gist--much much faster than manually
-    scraping, since it only takes 2 queries instead of ~2000. Also writes
-    the data to the same files. This is the intended way to use the
+    Syncs the nba/college datasets from gist--much much faster than
+    manually scraping, since it only takes 2 queries instead of ~2000, and
+    when the last sync is still current it's just one round trip of
+    conditional requests. Files that changed are verified, rebuilt next to
+    the old ones, and then swapped into 'data' together, so a failed sync
+    leaves the old data in place. This is the intended way to use the
     predictor.
     """
+    import io
+    import pandas as pd
+    from gist_sync import load_manifest, save_manifest, sync_artifacts
+
     print('initializing data...')
 
-    ssl._create_default_https_context = ssl._create_unverified_context
+    data_path = os.path.join(os.getcwd(), 'data')
+    manifest_path = os.path.join(data_path, 'gist_sync.json')
+    outputs = {'player_data': [os.path.join(data_path, 'player_data.npz'),
+                               os.path.join(data_path, 'player_data.csv')],
+               'college_players': [os.path.join(data_path,
+                                                'college_players.db')]}
+    os.makedirs(data_path, exist_ok=True)
+
+    # files that are gone, or were rewritten since (e.g. by a manual
+    # refresh), don't hold the synced data anymore
+    stamps = load_manifest(manifest_path).get('outputs', {})
+    replaced = any(not os.path.exists(path) or
+                   stamps.get(os.path.basename(path)) !=
+                   [os.stat(path).st_size, os.stat(path).st_mtime_ns]
+                   for paths in outputs.values() for path in paths)
+    changed, manifest = sync_artifacts(GIST_ARTIFACTS, manifest_path,
+                                       force=replaced)
+
+    if 'player_data' in changed:
+        player_df = pd.read_csv(io.BytesIO(changed['player_data']))
+        columns = ['name'] + FEATURES + CAREER_LABELS + ALLSTAR_LABELS
+        if not set(columns) <= set(player_df.columns):
+            raise ValueError('player_data: missing columns ' +
+                             str(sorted(set(columns) -
+                                        set(player_df.columns))))
+        save_player_data(player_df, suffix='.new')
+    if 'college_players' in changed:
+        cbb_json = json.loads(changed['college_players'])
+        if not isinstance(cbb_json, dict):
+            raise ValueError('college_players: not a dict of names/urls')
+        write_name_store(outputs['college_players'][0] + '.new', cbb_json)
+
+    for name in changed:
+        for path in outputs[name]:
+            os.replace(path + '.new', path)
+    manifest['outputs'] = {os.path.basename(path): [os.stat(path).st_size,
+                                                    os.stat(path).st_mtime_ns]
+                           for paths in outputs.values() for path in paths}
+    save_manifest(manifest_path, manifest)
+
+    print('synced ' + (', '.join(changed) or 'nothing, data is up to date'))
+
+
+def load_comparables_index(players_df):
+    """
+    Takes the player data and returns the comparables index for it (see
+    'comparables.py'), loading it from 'comparables.pkl' or building and
+    saving it if the data changed.
+    """
+    from comparables import load_comparables
 
-    if not os.path.exists(os.path.join(os.getcwd(), 'data')):
-        os.mkdir(os.path.join(os.getcwd(), 'data'))
+    return load_comparables(os.path.join(os.getcwd(), 'data',
+                                         'comparables.pkl'),
+                            os.path.join(os.getcwd(), 'data',
+                                         'player_data.npz'),
+                            players_df)
 
-    player_df = pd.read_csv(URL_CSV)
-    cbb_json = requests.get(URL_JSON).json()
 
-    player_df.to_csv(os.path.join(os.getcwd(), 'data', 'player_data.csv'))
-    with open(os.path.join(os.getcwd(), 'data', 'college_players.json'), 'w') \
-         as outfile:
-        json.dump(cbb_json, outfile)
+def load_player_name_index(cbb_players):
+    """
+    Takes the college player name store and returns the name index for
+    it (see 'name_index.py'), loading it from 'name_index.npz' or building
+    and saving it if the player list changed.
+    """
+    from name_index import load_name_index
+
+    return load_name_index(os.path.join(os.getcwd(), 'data',
+                                        'name_index.npz'),
+                           os.path.join(os.getcwd(), 'data',
+                                        'college_players.db'),
+                           cbb_players.keys)
 
 
-def find_similar_player(player, player_list):
+def find_similar_player(player, name_index, k=1):
     """
-    Takes a player string and a list of players, and returns the most similar
-    player from the player list. Very useful, since inputs must be case
-    sensitive & exact.
+    Takes a player string and a name index of college players, and returns
+    a list of up to k (name, similarity score) tuples for the most similar
+    players, best first. Very useful, since inputs must be case sensitive &
+    exact.
     """
-    most_similar = ''
-    high_similarity = 0
-    for other in player_list:
-        if player[0].lower() == other[0].lower():
-            similarity = SequenceMatcher(None, player, other).ratio()
-            if similarity > high_similarity:
-                most_similar = other
-                high_similarity = similarity
+    from name_index import search_name_index
 
-    return most_similar
+    return search_name_index(name_index, player, k)
 
 
-def train_model_careerstats(data, estimators, depth):
+def resolve_players(players, cbb_players, prompt=True, name_index=None):
     """
-    Takes a dataset (pandas df), an estimator count (int), and a depth (int).
-    Trains & returns a RandomForestRegressor model for player prime
-    and nba career length based on college stats, with the specified params.
+    Takes a list of player strings, the college players/urls (a dict or a
+    name store), and optionally an already loaded name index. Returns a
+    list with the valid college player name for each of them (None where
+    no name was accepted). Names that aren't found 1:1 are looked up in the
+    name index: with prompt, the user is asked about the closest
+    suggestion, and without it the closest suggestion is taken if its
+    score is at least MIN_MATCH_SCORE.
     """
-    data = data[['Points', 'Assists', 'Rebounds', 'FGP',
-                 'best_year', 'nba_career_length']].dropna()
+    players_valid = []
+
+    for player in players:
+        players_valid.append(None)
+        if player in cbb_players:
+            players_valid[-1] = player
+            continue
+
+        if name_index is None:
+            name_index = load_player_name_index(cbb_players)
+        matches = find_similar_player(player, name_index)
+        if not matches:
+            print(player + ' is not recognized as a valid college player')
+            continue
+
+        potential_player, score = matches[0]
+        if prompt:
+            r = input(player + ' is not recognized as a valid college player. Did you mean ' + potential_player + '? [y/n]\n>')
+            if r == 'y':
+                players_valid[-1] = potential_player
+        elif score >= MIN_MATCH_SCORE:
+            print(player + ' -> ' + potential_player +
+                  ' (score: ' + str(round(score, 2)) + ')')
+            players_valid[-1] = potential_player
+        else:
+            print(player + ' is not recognized as a valid college player, '
+                  'closest is ' + potential_player + ' (score: ' +
+                  str(round(score, 2)) + '), skipping')
+
+    return players_valid
 
-    features = data[['Points', 'Assists', 'Rebounds', 'FGP']].astype(float)
-    labels = data[['best_year', 'nba_career_length']].astype(float)
 
-    reg = RandomForestRegressor(n_estimators=estimators, max_depth=depth)
+def training_arrays(data):
+    """
+    Takes a dataset (pandas df) and builds the training arrays of both
+    models in one pass. Returns a dict with 'careerstats' & 'allstar'
+    (features, labels) tuples. Features are a C-contiguous float32 matrix
+    (the dtype sklearn's trees use, so fitting doesn't copy it), shared by
+    both models when they train on the same rows.
+    """
+    rows = data[FEATURES].notna().all(axis=1).to_numpy()
+    features = np.ascontiguousarray(data[FEATURES].to_numpy(np.float32)[rows])
+    labels = {'careerstats': (data[CAREER_LABELS], float),
+              'allstar': (data[ALLSTAR_LABELS[0]], bool)}
+
+    arrays = {}
+    for name, (label, dtype) in labels.items():
+        label = label[rows]
+        labeled = label.notna().to_numpy()
+        if labeled.ndim > 1:
+            labeled = labeled.all(axis=1)
+        arrays[name] = (features if labeled.all() else features[labeled],
+                        label[labeled].to_numpy(dtype))
+    return arrays
+
+
+@metrics.stage('train_careerstats')
+def train_model_careerstats(features, labels, estimators, depth,
+                            jobs=TRAIN_JOBS):
+    """
+    Takes the careerstats training arrays (see training_arrays), an
+    estimator count (int), a depth (int), and a number of threads to build
+    trees on (-1 for one per core). Trains & returns a
+    RandomForestRegressor model for player prime and nba career length
+    based on college stats, with the specified params.
+    """
+    from sklearn.ensemble import RandomForestRegressor
+
+    reg = RandomForestRegressor(n_estimators=estimators, max_depth=depth,
+                                n_jobs=jobs)
     reg.fit(features, labels)
     return reg
 
 
-def train_model_allstar(data, estimators, depth):
+@metrics.stage('train_allstar')
+def train_model_allstar(features, labels, estimators, depth,
+                        jobs=TRAIN_JOBS):
     """
-    Takes a dataset (pandas df), an estimator count (int), and a depth (int).
-    Trains & returns a RandomForestRegressor model for player prime
-    and nba career length based on college stats, with the specified params.
+    Takes the allstar training arrays (see training_arrays), an estimator
+    count (int), a depth (int), and a number of threads to build trees on
+    (-1 for one per core). Trains & returns a RandomForestClassifier model
+    for whether a player becomes an all-star based on college stats, with
+    the specified params.
     """
-    data = data[['Points', 'Assists', 'Rebounds', 'FGP', 'allstar']].dropna()
-
-    features = data[['Points', 'Assists', 'Rebounds', 'FGP']].astype(float)
-    label = data['allstar'].astype(bool)
+    from sklearn.ensemble import RandomForestClassifier
 
-    clf = RandomForestClassifier(n_estimators=estimators, max_depth=depth)
-    clf.fit(features, label)
+    clf = RandomForestClassifier(n_estimators=estimators, max_depth=depth,
+                                 n_jobs=jobs)
+    clf.fit(features, labels)
     return clf
 
 
-def test_models(data):
+def get_models(data, estimators, depth, jobs=TRAIN_JOBS):
     """
-    Takes a dataset (pandas df) of nba player data with college stats, and
-    trains a bunch of models with different params, while keeping track
-    of accuracy scores/mean squared error, and returning the params that
+    Takes a dataset (pandas df), an estimator count (int), a depth (int),
+    and a number of threads to build trees on (-1 for one per core).
+    Returns the careerstats & allstar models for the data, cached on disk
+    (see 'model_utils.py') and only retrained if their training data or
+    params changed. Models that need training are trained at the same
+    time, from training arrays built once, with the threads split between
+    them.
+    """
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from model_utils import cached_model
+
+    params = {'n_estimators': estimators, 'max_depth': depth}
+    arrays = {}
+    lock = threading.Lock()
+    # negative counts mean all cores but (-jobs - 1), like sklearn's n_jobs
+    threads = os.cpu_count() + 1 + jobs if jobs < 0 else jobs
+    jobs = max(1, threads // 2)
+
+    def train(name, train_model):
+        with lock:
+            if not arrays:
+                arrays.update(training_arrays(data))
+        return train_model(*arrays[name], estimators, depth, jobs)
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        career = pool.submit(cached_model, 'careerstats', data,
+                             FEATURES + CAREER_LABELS, params,
+                             lambda: train('careerstats',
+                                           train_model_careerstats))
+        allstar = pool.submit(cached_model, 'allstar', data,
+                              FEATURES + ALLSTAR_LABELS, params,
+                              lambda: train('allstar', train_model_allstar))
+        return career.result(), allstar.result()
+
+
+@metrics.stage('test_models')
+def test_models(data, jobs=TRAIN_JOBS):
+    """
+    Takes a dataset (pandas df) of nba player data with college stats and
+    a worker process count (-1 for one per core), and searches TEST_DEPTHS
+    x TEST_ESTIMATORS for both models (see 'search_utils.py'), keeping
+    track of accuracy scores/mean squared error and printing the score &
+    wall time of every candidate. Returns the regressor & classifier that
     produce the best results.
     """
+    from sklearn.ensemble import RandomForestClassifier,\
+        RandomForestRegressor
+    from sklearn.metrics import accuracy_score
+    from search_utils import neg_mean_squared_error, search_forests
+
     print('testing models...')
-    data = data[['Points', 'Assists', 'Rebounds', 'FGP',
-                 'best_year', 'nba_career_length', 'allstar']].dropna()
+    data = data[FEATURES + CAREER_LABELS + ALLSTAR_LABELS].dropna()
 
     train = data.sample(frac=0.75)
     test = data.drop(train.index)
 
-    best_reg = None
-    best_clf = None
-    best_mse = 0
-    best_ascore = 0
-
-    for est in range(100, 500, 100):
-        for depth in range(10, 50, 10):
-            reg = train_model_careerstats(train, est, depth)
-            clf = train_model_allstar(train, est, depth)
-            pred_r = reg.predict(test[['Points', 'Assists',
-                                       'Rebounds', 'FGP']])
-            pred_c = clf.predict(test[['Points', 'Assists',
-                                       'Rebounds', 'FGP']])
-
-            cur_mse = mean_squared_error(test[['best_year',
-                                               'nba_career_length']],
-                                         pred_r)
-            cur_ascore = accuracy_score(test[['allstar']], pred_c)
-
-            if cur_mse > best_mse:
-                print('regressor values updated to est:' + str(est) +
-                      ', depth: ' + str(depth))
-                best_reg = reg
-                best_mse = cur_mse
-            if cur_ascore > best_ascore:
-                print('classifier params updated to est:' + str(est) +
-                      ', depth: ' + str(depth))
-                best_clf = clf
-                best_ascore = cur_ascore
-
-    return best_reg, best_clf
+    searches = {
+        'regressor': {
+            'candidates': {'depth: ' + str(depth):
+                           RandomForestRegressor(max_depth=depth)
+                           for depth in TEST_DEPTHS},
+            'train': (train[FEATURES].astype(np.float32),
+                      train[CAREER_LABELS].astype(float)),
+            'test': (test[FEATURES].astype(np.float32),
+                     test[CAREER_LABELS].astype(float)),
+            'metric': neg_mean_squared_error
+        },
+        'classifier': {
+            'candidates': {'depth: ' + str(depth):
+                           RandomForestClassifier(max_depth=depth)
+                           for depth in TEST_DEPTHS},
+            'train': (train[FEATURES].astype(np.float32),
+                      train[ALLSTAR_LABELS[0]].astype(bool)),
+            'test': (test[FEATURES].astype(np.float32),
+                     test[ALLSTAR_LABELS[0]].astype(bool)),
+            'metric': accuracy_score
+        }
+    }
+
+    best, report = search_forests(searches, TEST_ESTIMATORS,
+                                  jobs if jobs > 0 else None)
+    for name in searches:
+        candidate, model, score, n_estimators = best[name]
+        seconds = sum(row['seconds'] for row in report
+                      if row['search'] == name)
+        print(name + ' params: est: ' + str(n_estimators) + ', ' +
+              candidate + ' (score: ' + str(round(score, 4)) + ', ' +
+              str(round(seconds, 2)) + 's of training)')
+        model.set_params(warm_start=False)
+
+    return best['regressor'][1], best['classifier'][1]
+
+
+@metrics.stage('predict')
+def predict_players(input_player_data, classifier_career,
+                    classifier_allstar, comparables=None):
+    """
+    Takes a list of player dicts with college stats (FEATURES) and both
+    models, and returns a list of the players' dicts with their projected
+    career length, prime & all-star chances added. Every player is scored
+    with one predict call per model. Players missing a stat (or with one
+    that isn't a finite number) get an 'error' instead. With a comparables index (see 'comparables.py'), the most
+    similar nba players are added as 'comparables', found for every player
+    in one query.
+    """
+    import pandas as pd
+
+    results = [dict(input_player) for input_player in input_player_data]
+    features = pd.DataFrame(results, columns=FEATURES)\
+        .apply(pd.to_numeric, errors='coerce')
+    valid = np.isfinite(features.to_numpy(np.float64)).all(axis=1)
+
+    metrics.count('predict.players', len(results))
+    metrics.count('predict.errors', int((~valid).sum()))
+    for i in np.flatnonzero(~valid):
+        results[i].setdefault('error', 'missing college stats')
+    if not valid.any():
+        return results
+
+    # the models are fit on float32 arrays (see training_arrays), so they're
+    # given the same, without column names
+    features = features[valid].to_numpy(np.float32)
+    careerstats = classifier_career.predict(features)
+    allstar_proba = classifier_allstar.predict_proba(features)
+    allstar = classifier_allstar.classes_[allstar_proba.argmax(axis=1)]
+    true_column = list(classifier_allstar.classes_).index(True) \
+        if True in classifier_allstar.classes_ else None
+
+    for row, i in enumerate(np.flatnonzero(valid)):
+        results[i]['projected_career_length'] = int(careerstats[row][1])
+        results[i]['projected_prime'] = int(careerstats[row][0])
+        results[i]['allstar'] = bool(allstar[row])
+        results[i]['allstar_probability'] = \
+            float(allstar_proba[row][true_column]) \
+            if true_column is not None else 0.0
+
+    if comparables is not None:
+        from comparables import find_comparables
+
+        predicted = np.flatnonzero(valid)
+        comp_stats = pd.DataFrame([results[i] for i in predicted],
+                                  columns=comparables['features'])\
+            .apply(pd.to_numeric, errors='coerce')
+        complete = comp_stats.notna().all(axis=1).to_numpy()
+        for i, comps in zip(predicted[complete],
+                            find_comparables(comparables,
+                                             comp_stats[complete])):
+            results[i]['comparables'] = comps
+
+    return results
+
+
+def has_college_stats(prospect):
+    """
+    Takes a prospect dict (see 'batch_utils.py') and returns whether it
+    already has every college stat the models use, so nothing needs to be
+    fetched for it.
+    """
+    return all(prospect.get(stat) not in (None, '') for stat in FEATURES)
+
+
+def predict_batch(prospects, cbb_players, classifier_career,
+                  classifier_allstar, name_index=None, finished=(),
+                  comparables=None):
+    """
+    Takes a list of prospect dicts (see 'batch_utils.py'), the college
+    players/urls (a dict or a name store), both models, and optionally an
+    already loaded name index, a collection of the names of players whose
+    college careers are over (e.g. the nba players in the data), and a
+    comparables index. Works through the prospects BATCH_SIZE at a
+    time: names of prospects without full college stats are resolved
+    without prompting, their stats are fetched concurrently, and the whole
+    chunk is predicted at once. Prospects whose pages can't be fetched get
+    an 'error' instead. Yields a prediction dict per prospect, in order.
+    """
+    for start in range(0, len(prospects), BATCH_SIZE):
+        chunk = [dict(prospect) for prospect in
+                 prospects[start:start + BATCH_SIZE]]
+        to_fetch = [prospect for prospect in chunk
+                    if not has_college_stats(prospect)
+                    and prospect.get('name')]
+
+        names = resolve_players([prospect['name'] for prospect in to_fetch],
+                                cbb_players, False, name_index)
+        for prospect, name in zip(to_fetch, names):
+            if name is None:
+                prospect['error'] = 'not recognized as a college player'
+        to_fetch = [(prospect, name) for prospect, name in
+                    zip(to_fetch, names) if name is not None]
+
+        fetched = []
+        if to_fetch:
+            from manual_utils import fetch_college_players_data
+
+            print('fetching data on ' + str(len(to_fetch)) + ' players...')
+            fetched = fetch_college_players_data(
+                [cbb_players[name] for prospect, name in to_fetch],
+                {cbb_players[name] for prospect, name in to_fetch
+                 if name in finished}, errors=True)
+        for (prospect, name), stats in zip(to_fetch, fetched):
+            prospect['query'] = prospect['name']
+            prospect['name'] = name
+            if isinstance(stats, Exception):
+                prospect['error'] = 'could not fetch college stats: ' + \
+                    str(stats)
+                continue
+            prospect.update(stats)
+
+        yield from predict_players(chunk, classifier_career,
+                                   classifier_allstar, comparables)
 
 
 def main():
@@ -228,65 +859,154 @@ def main():
     Trains a model and returns career predictions on inputted players. Will
     prompt the user if any input names aren't found 1:1 in the player list,
     and offer the closest suggestion. Checks if the script is running in
-    manual refresh vs gist refresh mode, as well as if it should test the
-    model params or just use the defaults.
+    manual refresh (or reparse) vs gist refresh mode, as well as if it
+    should test the model params or just use the defaults. With --batch,
+    predictions for a file of prospects are written to the --output file
+    instead (when that's stdout, everything else goes to stderr), and with
+    --serve it runs as a server (see 'predict_server.py'). With
+    --startup-profile, the time taken by each phase is printed at the end.
     """
-    refresh_manual, refresh_gist, players, is_test = process_args()
-
-    if refresh_manual:
-        init_data_manual()
-
-    if refresh_gist or not data_loaded():
-        init_data_gist()
-
-    players_df = pd.read_csv(os.path.join(os.getcwd(),
-                                          'data',
-                                          'player_data.csv'))
-    cbb_players = json.load(open(os.path.join(os.getcwd(),
-                                              'data',
-                                              'college_players.json'), 'r'))
-
-    players_valid = []
-    for player in players:
-        if player in cbb_players.keys():
-            players_valid.append(player)
-        else:
-            potential_player = find_similar_player(player,
-                                                   list(cbb_players.keys()))
-            r = input(player + ' is not recognized as a valid college player. Did you mean ' + potential_player + '? [y/n]\n>')
-            if r == 'y':
-                players_valid.append(potential_player)
+    profile = StartupProfile()
+    with profile.phase('parse args'):
+        args = process_args()
+    results_out = sys.stdout
+    if (args.batch and args.output == '-') or args.serve == 'stdio':
+        # stdout is kept for results (or server responses), so anything
+        # printed goes to stderr
+        sys.stdout = sys.stderr
+    if args.startup_profile:
+        profile.track_imports()
+    if args.metrics:
+        metrics.start(args.metrics)
+
+    # one page archive and college stats store are shared by everything
+    # the run fetches, and only opened (with the scraper behind them) by
+    # the paths that fetch pages
+    stores = {}
+
+    def use_stores(archive=True, stats=True):
+        """
+        Opens the page archive and the college stats store (those asked
+        for) the first time they're needed, closing them at exit. Returns
+        the archive, or None if it isn't open.
+        """
+        os.makedirs(os.path.join(os.getcwd(), 'data'), exist_ok=True)
+        if archive and 'archive' not in stores:
+            stores['archive'] = open_page_archive()
+            atexit.register(stores['archive'].close)
+        if stats and 'stats' not in stores:
+            stores['stats'] = open_stats_store(args.college_ttl)
+            atexit.register(stores['stats'].close)
+        return stores.get('archive')
+
+    with profile.phase('refresh data'):
+        if args.do_reparse:
+            # without the stats store, since --reparse rebuilds college
+            # stats from the archived pages themselves
+            init_data_reparse(use_stores(stats=False))
+
+        scrape = not args.do_reparse and (args.do_refresh_man or
+                                          args.do_resume)
+        if scrape:
+            use_stores()
+        if scrape and args.do_refresh_man and args.is_incremental:
+            init_data_incremental()
+        elif scrape:
+            init_data_manual(resume=args.do_resume)
+
+        if args.do_refresh_gist or not data_loaded():
+            init_data_gist()
+
+    if args.serve:
+        with profile.phase('load server'):
+            from predict_server import serve
+            # prospects the server is sent may need their stats fetched
+            use_stores(archive=False)
+        if args.startup_profile:
+            profile.report()
+        serve(args.serve, args.jobs, results_out)
+        return
+
+    with profile.phase('load data'):
+        players_df = load_player_data()
+        cbb_players = open_name_store(os.path.join(os.getcwd(), 'data',
+                                                   'college_players.db'))
+
+    with profile.phase('resolve names'):
+        players_valid = [player for player in
+                         resolve_players(args.players, cbb_players,
+                                         not args.no_prompt)
+                         if player is not None]
 
-    print('fetching data on input players...')
     input_player_data = []
-    for player in players_valid:
-        input_player_data.append({
-            'name': player,
-            **fetch_college_player_data(cbb_players[player])
-        })
-
-    if not is_test:
-        classifier_career = train_model_careerstats(players_df, 100, None)
-        classifier_allstar = train_model_allstar(players_df, 100, None)
-    else:
-        classifier_career, classifier_allstar = test_models(players_df)
-
-    for input_player in input_player_data:
-        input_player_careerstats = classifier_career.predict([[input_player['Points'],
-                                                               input_player['Assists'],
-                                                               input_player['Rebounds'],
-                                                               input_player['FGP']]])
-        input_player_allstar = classifier_allstar.predict([[input_player['Points'],
-                                                            input_player['Assists'],
-                                                            input_player['Rebounds'],
-                                                            input_player['FGP']]])
-        print(input_player)
-        print('projected career length: ' +
-              str(int(input_player_careerstats[0][1])) +
-              ' years')
-        print('projected prime: year ' +
-              str(int(input_player_careerstats[0][0])))
-        print('will become all-star: ' + str(input_player_allstar[0]))
+    if players_valid:
+        with profile.phase('fetch college stats'):
+            from manual_utils import fetch_college_players_data
+
+            use_stores()
+            print('fetching data on input players...')
+            finished = players_df['name'].isin(players_valid)
+            input_player_data = [
+                {'name': player, **stats} for player, stats in
+                zip(players_valid, fetch_college_players_data(
+                    [cbb_players[player] for player in players_valid],
+                    {cbb_players[player] for player in
+                     players_df['name'][finished]}))
+            ]
+
+    with profile.phase('load models'):
+        if not args.is_test:
+            classifier_career, classifier_allstar = get_models(
+                players_df, MODEL_ESTIMATORS, MODEL_DEPTH, args.jobs)
+        else:
+            classifier_career, classifier_allstar = test_models(players_df,
+                                                                args.jobs)
+
+    with profile.phase('load comparables'):
+        comparables = load_comparables_index(players_df)
+
+    if args.batch:
+        with profile.phase('batch predictions'):
+            prospects = read_prospects(args.batch)
+            if not all(has_college_stats(prospect)
+                       for prospect in prospects):
+                use_stores()
+            count = write_results(args.output,
+                                  predict_batch(prospects,
+                                                cbb_players,
+                                                classifier_career,
+                                                classifier_allstar,
+                                                finished=set(
+                                                    players_df['name']),
+                                                comparables=comparables),
+                                  results_out)
+            print(str(count) + ' predictions written to ' + args.output)
+
+    with profile.phase('predict'):
+        for input_player in predict_players(input_player_data,
+                                            classifier_career,
+                                            classifier_allstar,
+                                            comparables):
+            print({stat: value for stat, value in input_player.items()
+                   if stat not in PREDICTION_FIELDS})
+            if 'error' in input_player:
+                print('could not predict: ' + input_player['error'])
+                continue
+            print('projected career length: ' +
+                  str(input_player['projected_career_length']) +
+                  ' years')
+            print('projected prime: year ' +
+                  str(input_player['projected_prime']))
+            print('will become all-star: ' + str(input_player['allstar']))
+            print('most similar nba players:')
+            for comp in input_player.get('comparables', []):
+                print('    ' + comp['name'] + ': ' +
+                      str(comp['nba_career_length']) + ' year career, ' +
+                      'prime in year ' + str(comp['best_year']) +
+                      (', all-star' if comp['allstar'] else ''))
+
+    if args.startup_profile:
+        profile.report()
 
 
 if __name__ == '__main__':
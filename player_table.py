@@ -0,0 +1,94 @@
+"""
+Corey Zarkowski, Bryan Phan, Lawrence Lorbiecki -- CSE 163
+Typed binary copy of 'player_data.csv', used in 'player_predictor.py' and
+'predict_server.py'. The table is saved with a fixed schema (categorical
+name, float32 stats, bool allstar) as an uncompressed .npz, so loading it
+doesn't parse text or guess types, and the stats come back as one float32
+block that the dataframe uses without copying. The csv is still written
+next to it, but only as an export.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+from name_index import source_stamp
+
+# numeric columns, all stored as float32 (missing stats are NaN)
+STAT_COLUMNS = ['nba_career_length', 'Games', 'Points', 'Rebounds',
+                'Assists', 'FGP', 'FTP', 'EFGP', 'best_year', 'TFGP', 'WS']
+# every column of the table, in order
+COLUMNS = ['name'] + STAT_COLUMNS + ['url', 'allstar']
+
+
+def format_player_table(data):
+    """
+    Takes a dataframe of player data (e.g. read from a csv) and returns it
+    with the table schema: only COLUMNS, in order, with a categorical name,
+    float32 stats, string urls and a bool allstar. Missing columns are
+    added empty, and anything else (like the 'Unnamed: 0' index columns
+    older csv files picked up) is dropped.
+    """
+    data = data.reset_index(drop=True)
+
+    return pd.DataFrame({
+        'name': pd.Categorical(data['name'].astype(str)),
+        **{column: pd.to_numeric(data[column], errors='coerce')
+           .astype(np.float32) if column in data
+           else np.full(len(data), np.nan, dtype=np.float32)
+           for column in STAT_COLUMNS},
+        'url': data['url'].astype(str) if 'url' in data else '',
+        'allstar': data['allstar'].fillna(False).astype(bool)
+        if 'allstar' in data else False
+    })
+
+
+def save_player_table(data, path, source_path):
+    """
+    Takes a dataframe of player data and writes it, in the table schema,
+    to an .npz file at the given path, stamped with the csv at source_path.
+    The file is written next to the target and swapped in at the end.
+    """
+    table = format_player_table(data)
+    tmp_path = path + '.tmp'
+
+    with open(tmp_path, 'wb') as outfile:
+        np.savez(outfile,
+                 source=source_stamp(source_path),
+                 columns=np.array(STAT_COLUMNS),
+                 stats=np.ascontiguousarray(
+                     table[STAT_COLUMNS].to_numpy(np.float32).T),
+                 name_codes=table['name'].cat.codes.to_numpy(np.int32),
+                 name_categories=table['name'].cat.categories
+                 .to_numpy(str),
+                 url=table['url'].to_numpy(str),
+                 allstar=table['allstar'].to_numpy(bool))
+
+    os.replace(tmp_path, path)
+
+
+def load_player_table(path, source_path):
+    """
+    Loads the player table saved at path, and returns it as a dataframe
+    (in the table schema). Returns None if it's missing, or the csv at
+    source_path changed since it was saved.
+    """
+    if not os.path.exists(path):
+        return None
+
+    with np.load(path) as saved:
+        if os.path.exists(source_path) and not \
+           np.array_equal(saved['source'], source_stamp(source_path)):
+            return None
+        if list(saved['columns']) != STAT_COLUMNS:
+            return None
+
+        # stats are saved column by column, so the transpose is the
+        # (rows, columns) block pandas keeps, and isn't copied
+        table = pd.DataFrame(saved['stats'].T, columns=STAT_COLUMNS,
+                             copy=False)
+        table.insert(0, 'name', pd.Categorical.from_codes(
+            saved['name_codes'], saved['name_categories']))
+        table['url'] = saved['url'].astype(object)
+        table['allstar'] = saved['allstar']
+
+    return table
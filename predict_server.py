@@ -0,0 +1,222 @@
+"""
+Corey Zarkowski, Bryan Phan, Lawrence Lorbiecki -- CSE 163
+Resident prediction server, started with 'player_predictor.py --serve'.
+The data, name index and models are loaded once and kept in memory, and
+requests are answered over stdin/stdout (one JSON object per line) or a
+local HTTP endpoint. The data files are watched, and everything is
+reloaded in the background when they change.
+
+Requests are JSON objects with an 'op' (and optionally an 'id', which is
+echoed back):
+    {"op": "resolve", "names": [...], "k": 5}
+    {"op": "predict", "players": [name or dict of college stats, ...]}
+    {"op": "batch", "prospects": [...]}  (same as predict)
+    {"op": "status"}
+Over HTTP, the op can also be given as the path, e.g. POST /predict.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from player_predictor import find_similar_player, get_models,\
+                             load_comparables_index, load_player_data,\
+                             load_player_name_index, predict_batch,\
+                             MODEL_DEPTH, MODEL_ESTIMATORS, TRAIN_JOBS
+from name_store import open_name_store
+
+DATA_FILES = ['player_data.npz', 'college_players.db']
+# seconds between checks for changed data files
+RELOAD_INTERVAL = 2
+
+
+def data_stamp():
+    """
+    Returns the size & modification time of every data file, to tell when
+    they change.
+    """
+    stamp = []
+    for data_file in DATA_FILES:
+        stat = os.stat(os.path.join(os.getcwd(), 'data', data_file))
+        stamp.append((data_file, stat.st_size, stat.st_mtime_ns))
+    return stamp
+
+
+def load_state(jobs=TRAIN_JOBS):
+    """
+    Loads everything requests are answered from: the college player name
+    store, the names of players done with college, the name index, both
+    models (from the model cache when possible, or trained on jobs
+    threads), and the comparables index. Returns them in a dict, with the
+    data stamp they were loaded at.
+    """
+    players_df = load_player_data()
+    stamp = data_stamp()
+    cbb_players = open_name_store(os.path.join(os.getcwd(), 'data',
+                                               'college_players.db'))
+
+    career, allstar = get_models(players_df, MODEL_ESTIMATORS, MODEL_DEPTH,
+                                 jobs)
+
+    return {
+        'stamp': stamp,
+        'loaded_at': time.time(),
+        'cbb_players': cbb_players,
+        'finished': set(players_df['name']),
+        'name_index': load_player_name_index(cbb_players),
+        'career': career,
+        'allstar': allstar,
+        'comparables': load_comparables_index(players_df)
+    }
+
+
+def watch_data(server):
+    """
+    Takes the server dict and loops forever, reloading its state whenever
+    the data files change. A failed reload (e.g. a file caught half
+    written) is retried on the next check.
+    """
+    while True:
+        time.sleep(RELOAD_INTERVAL)
+        try:
+            if data_stamp() == server['state']['stamp']:
+                continue
+            print('data changed, reloading...')
+            old_state = server['state']
+            server['state'] = load_state(server['jobs'])
+            old_state['cbb_players'].close()
+            print('reloaded')
+        except Exception as err:
+            print('reload failed: ' + str(err))
+
+
+def handle_request(state, request):
+    """
+    Takes the server state and a request dict, and returns the response
+    dict. Raises ValueError for unknown ops.
+    """
+    op = request.get('op')
+
+    if op == 'resolve':
+        return {'results': [
+            {'query': name,
+             'exact': name in state['cbb_players'],
+             'matches': find_similar_player(name, state['name_index'],
+                                            request.get('k', 5))}
+            for name in request.get('names', [])
+        ]}
+
+    if op in ('predict', 'batch'):
+        prospects = [prospect if isinstance(prospect, dict)
+                     else {'name': prospect} for prospect in
+                     request.get('players', request.get('prospects', []))]
+        return {'results': list(predict_batch(prospects,
+                                              state['cbb_players'],
+                                              state['career'],
+                                              state['allstar'],
+                                              state['name_index'],
+                                              state['finished'],
+                                              state['comparables']))}
+
+    if op == 'status':
+        return {'loaded_at': state['loaded_at'],
+                'college_players': len(state['cbb_players'])}
+
+    raise ValueError('unknown op: ' + str(op))
+
+
+def respond(server, request):
+    """
+    Takes the server dict and a request (parsed JSON), and returns the
+    response, with the request's id echoed back and any error caught and
+    reported. Requests that aren't JSON objects get an error.
+    """
+    if not isinstance(request, dict):
+        return {'error': 'request must be a JSON object'}
+
+    try:
+        response = handle_request(server['state'], request)
+    except Exception as err:
+        response = {'error': str(err)}
+
+    if 'id' in request:
+        response['id'] = request['id']
+    return response
+
+
+def serve_stdio(server, out):
+    """
+    Answers JSON-lines requests from stdin on the given output stream (the
+    real stdout) until stdin closes.
+    """
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+        except ValueError as err:
+            response = {'error': 'invalid JSON: ' + str(err)}
+        else:
+            response = respond(server, request)
+        out.write(json.dumps(response) + '\n')
+        out.flush()
+
+
+def serve_http(server, port, host='127.0.0.1'):
+    """
+    Answers JSON requests POSTed to a local HTTP server on the given port,
+    forever. GET requests return the server status.
+    """
+    class RequestHandler(BaseHTTPRequestHandler):
+        def send_json(self, response):
+            body = json.dumps(response).encode()
+            self.send_response(400 if 'error' in response else 200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            self.send_json(respond(server, {'op': 'status'}))
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            try:
+                request = json.loads(self.rfile.read(length) or b'{}')
+            except ValueError as err:
+                self.send_json({'error': 'invalid JSON: ' + str(err)})
+                return
+            if isinstance(request, dict) and self.path.strip('/'):
+                request.setdefault('op', self.path.strip('/'))
+            self.send_json(respond(server, request))
+
+        def log_message(self, format, *args):
+            pass
+
+    httpd = ThreadingHTTPServer((host, port), RequestHandler)
+    print('serving on http://' + host + ':' + str(port))
+    httpd.serve_forever()
+
+
+def serve(mode, jobs=TRAIN_JOBS, out=None):
+    """
+    Takes a serving mode ('stdio', or a port number for HTTP), the number
+    of threads models are trained on, and for stdio, the stream responses
+    are written to (stdout by default, for callers that haven't already
+    sent stdout to stderr). Loads the server state, starts watching the
+    data files, and serves requests.
+    """
+    out = out or sys.stdout
+    if mode == 'stdio':
+        # stdout is kept for responses, so anything printed goes to stderr
+        sys.stdout = sys.stderr
+
+    server = {'state': load_state(jobs), 'jobs': jobs}
+    threading.Thread(target=watch_data, args=(server,), daemon=True).start()
+
+    if mode == 'stdio':
+        serve_stdio(server, out)
+    else:
+        serve_http(server, int(mode))
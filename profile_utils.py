@@ -0,0 +1,89 @@
+"""
+Corey Zarkowski, Bryan Phan, Lawrence Lorbiecki -- CSE 163
+Startup profiling for 'player_predictor.py --startup-profile'. A run is
+split into named phases, and each one's wall time is recorded along with
+how much of it went to importing modules (the heavy libraries are only
+imported by the phases that need them).
+"""
+
+import builtins
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# roughly when the script started: this module is its first import
+STARTED = time.perf_counter()
+
+
+class StartupProfile:
+    """
+    Records the phases of a run. Phase times are always recorded (it's
+    only a couple of clock reads); import times are tracked once
+    track_imports is called.
+    """
+
+    def __init__(self):
+        now = time.perf_counter()
+        self.import_seconds = 0.0
+        self.depth = 0
+        self.thread = threading.get_ident()
+        self.phases = [{'phase': 'module imports', 'seconds': now - STARTED,
+                        'import_seconds': now - STARTED,
+                        'modules': len(sys.modules)}]
+
+    def track_imports(self):
+        """
+        Wraps the import function so that time spent in top-level imports
+        on this thread is counted (nested imports are part of the outer
+        one, and other threads' imports are left out).
+        """
+        real_import = builtins.__import__
+
+        def timed_import(*args, **kwargs):
+            if self.depth or threading.get_ident() != self.thread:
+                return real_import(*args, **kwargs)
+            self.depth += 1
+            start = time.perf_counter()
+            try:
+                return real_import(*args, **kwargs)
+            finally:
+                self.depth -= 1
+                self.import_seconds += time.perf_counter() - start
+
+        builtins.__import__ = timed_import
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Context manager that records the code run in it as a phase with
+        the given name.
+        """
+        start = time.perf_counter()
+        import_seconds = self.import_seconds
+        modules = len(sys.modules)
+        try:
+            yield
+        finally:
+            self.phases.append({
+                'phase': name,
+                'seconds': time.perf_counter() - start,
+                'import_seconds': self.import_seconds - import_seconds,
+                'modules': len(sys.modules) - modules
+            })
+
+    def report(self, out=None):
+        """
+        Prints a table of the recorded phases (total, import & init time,
+        and modules loaded) and the total, to stderr by default.
+        """
+        out = out or sys.stderr
+        print('{:<22}{:>9}{:>9}{:>9}{:>9}'.format(
+            'phase', 'total', 'import', 'init', 'modules'), file=out)
+        for phase in self.phases:
+            print('{:<22}{:>8.3f}s{:>8.3f}s{:>8.3f}s{:>9}'.format(
+                phase['phase'], phase['seconds'], phase['import_seconds'],
+                phase['seconds'] - phase['import_seconds'],
+                phase['modules']), file=out)
+        print('{:<22}{:>8.3f}s'.format(
+            'total', time.perf_counter() - STARTED), file=out)
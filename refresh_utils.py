@@ -0,0 +1,219 @@
+"""
+Corey Zarkowski, Bryan Phan, Lawrence Lorbiecki -- CSE 163
+Checkpointed manual refresh, used by init_data_manual in
+'player_predictor.py'. Every page is parsed as it comes in and its records
+are written to a work directory right away: the college player index goes
+into a name store, season rows into one csv per season, and college stats
+into a JSON-lines file, one player per line. Finished steps are recorded
+in 'checkpoint.json', so an interrupted refresh can be resumed, redoing
+only the work that wasn't written yet. The season rows and college stats
+are still read back in full at the end of their steps, to build the
+season table and player data from.
+"""
+
+import json
+import os
+import shutil
+import string
+from datetime import date
+import pandas as pd
+import manual_utils
+import metrics
+from manual_utils import SEASON_STAT_FIELDS, build_season_table,\
+                         college_stats, fetch_nba_player_URLs,\
+                         parse_cbb_index_page, parse_season_page
+from name_store import update_name_store, write_name_store
+from scrape_utils import fetch_parsed
+
+CHECKPOINT_FILE = 'checkpoint.json'
+# college stat lines written between flushes to disk
+FLUSH_EVERY = 50
+
+
+def start_refresh(work_dir, first_year, last_year, resume=False):
+    """
+    Takes the work directory, the range of seasons to scrape, and whether
+    to resume. Returns the checkpoint (dict) of the refresh in work_dir if
+    resuming and there is one, or else clears work_dir and returns a new
+    checkpoint.
+    """
+    path = os.path.join(work_dir, CHECKPOINT_FILE)
+    if resume and os.path.exists(path):
+        with open(path, 'r') as infile:
+            checkpoint = json.load(infile)
+        print('resuming refresh started on ' + checkpoint['started'] +
+              ' (done: ' + (', '.join(checkpoint['done']) or 'nothing') +
+              ')')
+        return checkpoint
+    if resume:
+        print('no refresh to resume, starting a new one')
+
+    shutil.rmtree(work_dir, ignore_errors=True)
+    os.makedirs(os.path.join(work_dir, 'seasons'))
+    checkpoint = {'started': date.today().isoformat(),
+                  'first_year': first_year, 'last_year': last_year,
+                  'done': [], 'cbb_letters': []}
+    save_checkpoint(work_dir, checkpoint)
+    return checkpoint
+
+
+def save_checkpoint(work_dir, checkpoint):
+    """
+    Writes a checkpoint to the work directory, replacing the old one in one
+    step.
+    """
+    path = os.path.join(work_dir, CHECKPOINT_FILE)
+    with open(path + '.tmp', 'w') as outfile:
+        json.dump(checkpoint, outfile)
+    os.replace(path + '.tmp', path)
+
+
+def finish_step(work_dir, checkpoint, step):
+    """
+    Records a step of the refresh as done.
+    """
+    checkpoint['done'].append(step)
+    save_checkpoint(work_dir, checkpoint)
+
+
+def refresh_nba_players(work_dir, checkpoint):
+    """
+    Returns the dict of nba player names/urls, scraped (and saved to the
+    work directory) unless an earlier run already did.
+    """
+    path = os.path.join(work_dir, 'nba_players.json')
+    if 'nba_players' not in checkpoint['done']:
+        with open(path, 'w') as outfile:
+            json.dump(fetch_nba_player_URLs(), outfile)
+        finish_step(work_dir, checkpoint, 'nba_players')
+
+    with open(path, 'r') as infile:
+        return json.load(infile)
+
+
+@metrics.stage('cbb_player_urls')
+def refresh_cbb_players(work_dir, checkpoint):
+    """
+    Scrapes the college player index into a name store in the work
+    directory, one letter at a time, skipping letters an earlier run
+    finished. Returns the path of the name store.
+    """
+    path = os.path.join(work_dir, 'college_players.db')
+    if 'cbb_players' in checkpoint['done']:
+        return path
+    if not checkpoint['cbb_letters']:
+        write_name_store(path, {})
+
+    print('fetching cbb player urls...')
+    letters = [letter for letter in string.ascii_lowercase
+               if letter not in checkpoint['cbb_letters']]
+    pages = [(manual_utils.CBB_URL + '/players/' + letter + '-index.html',
+              parse_cbb_index_page) for letter in letters]
+
+    for letter, (URL, players_cbb) in zip(letters, fetch_parsed(pages)):
+        update_name_store(path, players_cbb)
+        metrics.count('parse.cbb_players', len(players_cbb))
+        checkpoint['cbb_letters'].append(letter)
+        save_checkpoint(work_dir, checkpoint)
+
+    finish_step(work_dir, checkpoint, 'cbb_players')
+    return path
+
+
+@metrics.stage('nba_seasons')
+def refresh_seasons(work_dir, checkpoint, players):
+    """
+    Takes the nba player names to keep, and scrapes the season totals page
+    of every season in the checkpoint's range, writing each season's rows
+    to its own csv as soon as it's parsed. Seasons already written are
+    skipped. Returns the season table of every season (see
+    'manual_utils.py'), read back from all of the csvs.
+    """
+    players = set(players)
+    years = range(checkpoint['first_year'], checkpoint['last_year'] + 1)
+
+    def season_path(year):
+        return os.path.join(work_dir, 'seasons', str(year) + '.csv')
+
+    todo = [year for year in years if not os.path.exists(season_path(year))]
+    pages = [(manual_utils.NBA_URL + '/leagues/NBA_' + str(year) +
+              '_totals.html', parse_season_page) for year in todo]
+    print('retrieving nba career data (' + str(len(todo)) + ' of ' +
+          str(len(years)) + ' seasons left)...')
+
+    for year, (URL, rows) in zip(todo, fetch_parsed(pages)):
+        metrics.count('parse.season_rows', len(rows))
+        kept = [(name, row) for name, row in rows if name in players]
+        metrics.count('parse.season_rows_dropped', len(rows) - len(kept))
+
+        pd.DataFrame([{'name': name, 'year': year, **row}
+                      for name, row in kept],
+                     columns=['name', 'year'] +
+                     list(SEASON_STAT_FIELDS.values()))\
+            .to_csv(season_path(year) + '.tmp', index=False)
+        os.replace(season_path(year) + '.tmp', season_path(year))
+
+    seasons = pd.concat([pd.read_csv(season_path(year),
+                                     dtype={'name': str})
+                         for year in years], ignore_index=True)
+    return build_season_table(seasons['name'], seasons['year'],
+                              {column: seasons[column] for column in
+                               SEASON_STAT_FIELDS.values()})
+
+
+def read_college_lines(path):
+    """
+    Reads the college stats JSON-lines file of a refresh and returns a dict
+    of player names to stats. A line cut off by an interrupted write is
+    dropped from the file, so appending can carry on after it.
+    """
+    college_data = {}
+    if not os.path.exists(path):
+        return college_data
+
+    with open(path, 'rb+') as infile:
+        good = 0
+        for line in infile:
+            if not line.endswith(b'\n'):
+                break
+            record = json.loads(line)
+            college_data[record.pop('name')] = record
+            good += len(line)
+        infile.truncate(good)
+
+    return college_data
+
+
+@metrics.stage('college_stats')
+def refresh_college_data(work_dir, players_cbb, players):
+    """
+    Takes the college players/urls (a dict or name store) & an iterable of
+    nba player names. Scrapes college data for every nba player with a
+    college page who doesn't have a line in the work directory's
+    JSON-lines file yet, appending a line per player as it comes in. The
+    stats go through the college stats store when one is in use (see
+    manual_utils.college_stats), and nba players are done with college, so
+    theirs never expire.
+    Returns a dict of every player's name to their college stats, read
+    back from the whole file.
+    """
+    path = os.path.join(work_dir, 'college_stats.jsonl')
+    done = set(read_college_lines(path))
+    players = [player for player in players
+               if player in players_cbb and player not in done]
+    player_urls = [players_cbb[player] for player in players]
+
+    print('fetching college data for nba players (' + str(len(players)) +
+          ' left, ' + str(len(done)) + ' done)...')
+    print('this may take a while')
+
+    with open(path, 'a') as outfile:
+        for count, (player, stats) in enumerate(
+                zip(players, college_stats(player_urls, set(player_urls))),
+                1):
+            outfile.write(json.dumps({'name': player, **stats}) + '\n')
+            if count % FLUSH_EVERY == 0:
+                outfile.flush()
+                print(str(int(count / len(players) * 100)) + '%')
+
+    return read_college_lines(path)
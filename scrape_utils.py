@@ -0,0 +1,293 @@
+"""
+Corey Zarkowski, Bryan Phan, Lawrence Lorbiecki -- CSE 163
+Scraping engine used by 'manual_utils.py'. Pages are fetched on a bounded
+thread pool with pooled keep-alive sessions, per-host concurrency and rate
+limits, and retry with backoff when a site throttles us or errors out.
+With a page archive in use (see 'page_archive.py'), every fetched page is
+stored, requests for archived pages are conditional, and in offline mode
+pages are only read from the archive. Requests, bytes, retries, waits and
+archive hits are counted in 'metrics.py', along with the latency of every
+request and of every page (including retries and waits).
+"""
+
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+import metrics
+from page_archive import parse_archived
+
+MAX_WORKERS = 8
+HOST_CONCURRENCY = 4
+# sports-reference.com & basketball-reference.com ask for at most 20
+# requests a minute, so that's the default for every host
+HOST_RATE = 20 / 60
+RETRIES = 4
+BACKOFF = 2.0
+TIMEOUT = 30
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# request errors that retrying can't fix (every other one is retried, e.g.
+# dropped connections, timeouts and truncated or garbled bodies)
+FATAL_ERRORS = (requests.exceptions.InvalidURL,
+                requests.exceptions.InvalidSchema,
+                requests.exceptions.MissingSchema,
+                requests.exceptions.InvalidHeader,
+                requests.exceptions.TooManyRedirects)
+
+_host_limits = {}
+_hosts = {}
+_hosts_lock = threading.Lock()
+_local = threading.local()
+_archive = None
+_offline = False
+
+
+def configure(max_workers=None, host_concurrency=None, host_rate=None,
+              retries=None, backoff=None):
+    """
+    Changes the engine's default limits. Any argument left as None keeps
+    its current value. host_rate is in requests per second (0 for no
+    limit).
+    """
+    global MAX_WORKERS, HOST_CONCURRENCY, HOST_RATE, RETRIES, BACKOFF
+
+    if max_workers is not None:
+        MAX_WORKERS = max_workers
+    if host_concurrency is not None:
+        HOST_CONCURRENCY = host_concurrency
+    if host_rate is not None:
+        HOST_RATE = host_rate
+    if retries is not None:
+        RETRIES = retries
+    if backoff is not None:
+        BACKOFF = backoff
+
+    with _hosts_lock:
+        _hosts.clear()
+
+
+def set_host_limit(host, concurrency, rate):
+    """
+    Takes a host name, a max number of requests in flight to it (int), and
+    a max request rate in requests per second (float, or None for no
+    limit). Overrides the engine defaults for that host.
+    """
+    with _hosts_lock:
+        _host_limits[host] = (concurrency, rate)
+        _hosts.pop(host, None)
+
+
+def use_archive(archive, offline=False):
+    """
+    Takes a PageArchive (or None to stop archiving) and whether to work
+    offline. Fetched pages are stored in the archive, and pages it has are
+    requested conditionally (an unchanged page is read from the archive).
+    Offline, pages are read from the archive and nothing is requested.
+    """
+    global _archive, _offline
+
+    _archive = archive
+    _offline = offline and archive is not None
+
+
+def _get_host(host):
+    """
+    Returns the limiter state for a host, creating it on first use.
+    """
+    with _hosts_lock:
+        if host not in _hosts:
+            concurrency, rate = _host_limits.get(host, (HOST_CONCURRENCY,
+                                                        HOST_RATE))
+            _hosts[host] = {
+                'slots': threading.BoundedSemaphore(concurrency),
+                'interval': 1 / rate if rate else 0,
+                'next': 0.0,
+                'lock': threading.Lock()
+            }
+        return _hosts[host]
+
+
+def _wait_turn(host_state):
+    """
+    Blocks until the host's rate limit allows another request.
+    """
+    with host_state['lock']:
+        now = time.monotonic()
+        start = max(now, host_state['next'])
+        host_state['next'] = start + host_state['interval']
+
+    if start > now:
+        time.sleep(start - now)
+
+
+def _get_session():
+    """
+    Returns this thread's keep-alive session, creating it on first use.
+    """
+    if not hasattr(_local, 'session'):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=MAX_WORKERS)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _local.session = session
+    return _local.session
+
+
+def _retry_delay(attempt, response):
+    """
+    Returns how long to wait before retry number 'attempt', honoring the
+    server's Retry-After header if it sent one.
+    """
+    if response is not None:
+        retry_after = response.headers.get('Retry-After', '')
+        if retry_after.isdigit():
+            return float(retry_after)
+    return BACKOFF * 2 ** attempt * (0.5 + random.random() / 2)
+
+
+def fetch_page(url):
+    """
+    Takes a URL and returns the body of the page (bytes). Requests are
+    limited per host, and request errors (other than FATAL_ERRORS),
+    throttling and server errors are retried with exponential backoff.
+    Raises the last error if every retry fails. Offline, raises LookupError
+    for pages that aren't archived.
+    """
+    page_start = time.perf_counter()
+    try:
+        return _fetch_page(url)
+    finally:
+        metrics.observe('scrape.page_seconds',
+                        time.perf_counter() - page_start)
+
+
+def _fetch_page(url):
+    """
+    Fetches a page for fetch_page.
+    """
+    archive = _archive
+    record = archive.latest(url) if archive is not None else None
+    if _offline:
+        if record is None:
+            metrics.count('archive.misses')
+            raise LookupError(url + ' is not in the page archive')
+        metrics.count('archive.hits')
+        return archive.read(record['digest'])
+
+    headers = {}
+    if record is not None and record['etag']:
+        headers['If-None-Match'] = record['etag']
+    if record is not None and record['last_modified']:
+        headers['If-Modified-Since'] = record['last_modified']
+
+    host_state = _get_host(urlsplit(url).netloc)
+
+    for attempt in range(RETRIES + 1):
+        response = None
+        waited = time.perf_counter()
+        with host_state['slots']:
+            _wait_turn(host_state)
+            start = time.perf_counter()
+            metrics.count('scrape.wait_seconds', start - waited)
+            metrics.count('scrape.requests')
+            try:
+                response = _get_session().get(url, timeout=TIMEOUT,
+                                              headers=headers)
+            except FATAL_ERRORS:
+                raise
+            except requests.RequestException:
+                metrics.count('scrape.connection_errors')
+                if attempt == RETRIES:
+                    raise
+            finally:
+                metrics.count('scrape.request_seconds',
+                              time.perf_counter() - start)
+                metrics.observe('scrape.request_seconds',
+                                time.perf_counter() - start)
+
+        if response is not None:
+            metrics.count('scrape.status.' + str(response.status_code))
+        if response is not None and response.status_code == 304 and \
+           record is not None:
+            metrics.count('archive.hits')
+            archive.record(url, record['digest'], record['etag'],
+                           record['last_modified'])
+            return archive.read(record['digest'])
+        if response is not None and \
+           response.status_code not in RETRY_STATUSES:
+            metrics.count('scrape.bytes', len(response.content))
+            if archive is not None and response.status_code == 200:
+                metrics.count('archive.misses')
+                archive.store(url, response.content,
+                              response.headers.get('ETag'),
+                              response.headers.get('Last-Modified'))
+            return response.content
+        if response is not None and attempt == RETRIES:
+            response.raise_for_status()
+
+        metrics.count('scrape.retries')
+        time.sleep(_retry_delay(attempt, response))
+
+
+def fetch_pages(urls, errors=False):
+    """
+    Takes an iterable of URLs and fetches them concurrently. Yields
+    (url, page body) tuples in the same order as the input. Only a couple
+    of pages per worker are requested ahead of the one being yielded, so
+    memory use doesn't grow with the number of URLs. A page that can't be
+    fetched raises its error, or with errors, is yielded with the error
+    (an exception) in place of its body.
+    """
+    def result(future):
+        if not errors:
+            return future.result()
+        try:
+            return future.result()
+        except (requests.RequestException, LookupError) as err:
+            metrics.count('scrape.page_errors')
+            return err
+
+    pool = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+    pending = deque()
+    try:
+        for url in urls:
+            pending.append((url, pool.submit(fetch_page, url)))
+            if len(pending) >= 2 * MAX_WORKERS:
+                url, future = pending.popleft()
+                yield url, result(future)
+        while pending:
+            url, future = pending.popleft()
+            yield url, result(future)
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+
+def fetch_parsed(pages, workers=None, errors=False):
+    """
+    Takes an iterable of (url, parse function) tuples, and yields (url,
+    parse(page body)) tuples in the same order. Pages are fetched
+    concurrently and parsed as they come in; offline, they're read from the
+    archive and parsed on a pool of 'workers' processes instead. With
+    errors, a page that can't be fetched is yielded with its error in
+    place of the parsed data instead of raising it (see fetch_pages).
+    """
+    pages = list(pages)
+    if _offline:
+        yield from parse_archived(_archive, pages, workers)
+        return
+
+    for (url, parse), (URL, data) in zip(pages,
+                                         fetch_pages((url for url, parse
+                                                      in pages), errors)):
+        if isinstance(data, Exception):
+            yield url, data
+            continue
+        start = time.perf_counter()
+        parsed = parse(data)
+        metrics.count('parse.seconds', time.perf_counter() - start)
+        yield url, parsed
@@ -0,0 +1,93 @@
+"""
+Corey Zarkowski, Bryan Phan, Lawrence Lorbiecki -- CSE 163
+Hyperparameter search for the random forests, used by 'test_models' in
+'player_predictor.py'. Candidates are trained on a process pool, forests
+are grown with warm_start along the estimator axis instead of being
+refit, and the worse half of the candidates is dropped after every step
+(successive halving).
+"""
+
+import math
+import time
+from concurrent.futures import ProcessPoolExecutor
+from sklearn.metrics import mean_squared_error
+
+
+def neg_mean_squared_error(labels, predictions):
+    """
+    Returns the negative mean squared error of the predictions, so that
+    like accuracy, a higher score is better.
+    """
+    return -mean_squared_error(labels, predictions)
+
+
+def grow_forest(model, n_estimators, train, test, metric):
+    """
+    Takes a (possibly already fit) forest, a tree count, train & test
+    (features, labels) tuples, and a metric. Grows the forest to
+    n_estimators trees, keeping any trees it already has, and returns the
+    forest, its score on the test data, and the seconds it took.
+    """
+    start = time.perf_counter()
+    model.set_params(n_estimators=n_estimators, warm_start=True, n_jobs=1)
+    model.fit(*train)
+    score = metric(test[1], model.predict(test[0]))
+
+    return model, score, time.perf_counter() - start
+
+
+def search_forests(searches, rungs, workers=None, keep=0.5):
+    """
+    Takes a dict of search names to dicts with 'candidates' (dict of
+    candidate names to unfit forests), 'train' & 'test' ((features, labels)
+    tuples) and 'metric' (function, higher is better), an increasing list
+    of tree counts, a worker process count (None for one per core), and
+    the share of candidates kept after each rung.
+
+    Every surviving candidate of every search is grown to the next tree
+    count in parallel, then only the best 'keep' share of each search moves
+    on. Returns a dict of search names to the best (candidate name, forest,
+    score, tree count) seen, and a list of dicts with the score & wall
+    time of every candidate at every rung.
+    """
+    alive = {name: dict(search['candidates'])
+             for name, search in searches.items()}
+    best = {}
+    report = []
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for n_estimators in rungs:
+            futures = {
+                (name, candidate): pool.submit(grow_forest, model,
+                                               n_estimators,
+                                               searches[name]['train'],
+                                               searches[name]['test'],
+                                               searches[name]['metric'])
+                for name, candidates in alive.items()
+                for candidate, model in candidates.items()
+            }
+
+            scores = {name: {} for name in alive}
+            for (name, candidate), future in futures.items():
+                model, score, seconds = future.result()
+                alive[name][candidate] = model
+                scores[name][candidate] = score
+                report.append({'search': name, 'candidate': candidate,
+                               'n_estimators': n_estimators,
+                               'score': score, 'seconds': seconds})
+                print(name + ' ' + str(candidate) + ', est: ' +
+                      str(n_estimators) + ', score: ' +
+                      str(round(score, 4)) + ' (' +
+                      str(round(seconds, 2)) + 's)')
+
+                if name not in best or score > best[name][2]:
+                    best[name] = (candidate, model, score, n_estimators)
+
+            for name in alive:
+                ranked = sorted(scores[name], key=scores[name].get,
+                                reverse=True)
+                kept = ranked[:max(1, math.ceil(len(ranked) * keep))]
+                alive[name] = {candidate: alive[name][candidate]
+                               for candidate in kept}
+
+    return best, report
@@ -0,0 +1,75 @@
+"""
+Tests for 'forest_model.py': exported forests have to predict exactly what
+the sklearn forests they came from do.
+"""
+
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+from forest_model import export_forest, load_forest
+
+
+@pytest.fixture
+def data():
+    """
+    Returns float32 training features, careerstats-like labels (2 outputs),
+    allstar-like labels, and a separate set of float32 features to predict.
+    """
+    rng = np.random.default_rng(0)
+    features = rng.uniform(0, 30, (200, 4)).astype(np.float32)
+    career = rng.integers(1, 15, (200, 2)).astype(float)
+    allstar = features[:, 0] + rng.normal(0, 5, 200) > 20
+    unseen = rng.uniform(-5, 35, (500, 4)).astype(np.float32)
+    return features, career, allstar, unseen
+
+
+def test_regressor_matches_sklearn(data, tmp_path):
+    """
+    A 2 output regressor predicts the same values as sklearn, bit for bit.
+    """
+    features, career, allstar, unseen = data
+    model = RandomForestRegressor(n_estimators=20, max_depth=8,
+                                  random_state=0).fit(features, career)
+    export_forest(model, str(tmp_path / 'career'))
+    forest = load_forest(str(tmp_path / 'career'))
+
+    assert np.array_equal(forest.predict(unseen), model.predict(unseen))
+    assert np.array_equal(forest.predict(features), model.predict(features))
+
+
+def test_classifier_matches_sklearn(data, tmp_path):
+    """
+    A classifier gives the same probabilities & classes as sklearn.
+    """
+    features, career, allstar, unseen = data
+    model = RandomForestClassifier(n_estimators=20, random_state=0)\
+        .fit(features, allstar)
+    export_forest(model, str(tmp_path / 'allstar'))
+    forest = load_forest(str(tmp_path / 'allstar'))
+
+    assert np.array_equal(forest.classes_, model.classes_)
+    assert np.array_equal(forest.predict_proba(unseen),
+                          model.predict_proba(unseen))
+    assert np.array_equal(forest.predict(unseen), model.predict(unseen))
+
+
+@pytest.mark.parametrize('value', [np.nan, np.inf, -np.inf])
+def test_non_finite_features_are_rejected(data, tmp_path, value):
+    """
+    Infinite features are rejected like sklearn does, and NaN (which sklearn
+    routes by missing value rules that aren't exported) is too.
+    """
+    features, career, allstar, unseen = data
+    model = RandomForestClassifier(n_estimators=5, random_state=0)\
+        .fit(features, allstar)
+    export_forest(model, str(tmp_path / 'allstar'))
+    forest = load_forest(str(tmp_path / 'allstar'))
+
+    unseen[3, 2] = value
+    with pytest.raises(ValueError):
+        forest.predict(unseen)
+    with pytest.raises(ValueError):
+        forest.predict_proba(unseen)
+    if not np.isnan(value):
+        with pytest.raises(ValueError):
+            model.predict(unseen)
@@ -0,0 +1,84 @@
+"""
+Tests for 'gist_sync.py', run against a local stand-in for gist (see
+'mock_site.py').
+"""
+
+import hashlib
+import pytest
+from gist_sync import save_manifest, sync_artifacts
+from mock_site import MockSite
+
+CSV = b'name,Points\nAnn Baker,10.5\n'
+JSON = b'{"Ann Baker": "/ann-baker-1.html"}'
+
+
+@pytest.fixture
+def gist():
+    """
+    Serves the two artifacts, and returns the running MockSite.
+    """
+    site = MockSite({'/data.csv': CSV, '/names.json': JSON}).start()
+    yield site
+    site.stop()
+
+
+def artifacts(site, **options):
+    """
+    Returns the artifact dicts of the stand-in's files.
+    """
+    return {'player_data': dict(url=site.url + '/data.csv', **options),
+            'college_players': dict(url=site.url + '/names.json',
+                                    **options)}
+
+
+def test_first_sync_then_up_to_date(gist, tmp_path):
+    """
+    The first sync downloads everything, and the next one is answered with
+    304s and changes nothing.
+    """
+    manifest_path = str(tmp_path / 'gist_sync.json')
+    changed, manifest = sync_artifacts(artifacts(gist), manifest_path)
+    assert changed == {'player_data': CSV, 'college_players': JSON}
+    save_manifest(manifest_path, manifest)
+
+    changed, manifest = sync_artifacts(artifacts(gist), manifest_path)
+    assert changed == {}
+    assert gist.stats['status'][304] == 2
+
+
+def test_pinned_sha256_mismatch(gist, tmp_path):
+    """
+    A download that doesn't match its pinned sha256 is rejected.
+    """
+    with pytest.raises(ValueError, match='pinned'):
+        sync_artifacts(artifacts(gist, sha256='0' * 64),
+                       str(tmp_path / 'gist_sync.json'))
+
+    changed, manifest = sync_artifacts(
+        {'player_data': {'url': gist.url + '/data.csv',
+                         'sha256': hashlib.sha256(CSV).hexdigest()}},
+        str(tmp_path / 'gist_sync.json'))
+    assert changed == {'player_data': CSV}
+
+
+def test_immutable_pinned_on_first_sync(gist, tmp_path):
+    """
+    Immutable artifacts are pinned to their first download, even through
+    forced syncs, and a changed body is rejected.
+    """
+    manifest_path = str(tmp_path / 'gist_sync.json')
+    changed, manifest = sync_artifacts(artifacts(gist, immutable=True),
+                                       manifest_path)
+    assert manifest['player_data']['pinned_sha256'] == \
+        hashlib.sha256(CSV).hexdigest()
+    save_manifest(manifest_path, manifest)
+
+    changed, manifest = sync_artifacts(artifacts(gist, immutable=True),
+                                       manifest_path, force=True)
+    assert changed == {'player_data': CSV, 'college_players': JSON}
+    save_manifest(manifest_path, manifest)
+
+    gist.pages['/data.csv'] = CSV + b'Ben Carter,3.0\n'
+    with pytest.raises(ValueError, match='pinned'):
+        sync_artifacts(artifacts(gist, immutable=True), manifest_path,
+                       force=True)
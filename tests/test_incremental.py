@@ -0,0 +1,86 @@
+"""
+Tests for init_data_incremental in 'player_predictor.py', run against
+stub scrapers in a temporary data directory.
+"""
+
+import json
+from datetime import date
+import pandas as pd
+import pytest
+import manual_utils
+import player_predictor
+from manual_utils import SEASON_STAT_FIELDS, build_season_table,\
+                         save_season_table
+from name_store import write_name_store
+
+
+def season_table(rows):
+    """
+    Returns a season table with the given (name, year) rows, all with the
+    same stats.
+    """
+    return build_season_table([name for name, year in rows],
+                              [year for name, year in rows],
+                              {column: [10.0] * len(rows)
+                               for column in SEASON_STAT_FIELDS.values()})
+
+
+@pytest.fixture
+def refreshed(tmp_path, monkeypatch):
+    """
+    Sets up the data of an earlier manual refresh where every season up to
+    2026 is closed, with the scrapers stubbed out. Returns the list the
+    stubbed season scraper records its (players, first_year, last_year)
+    calls in.
+    """
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'data').mkdir()
+    save_season_table(season_table([('Ann Baker', 2025), ('Ann Baker', 2026)]),
+                      str(tmp_path / 'data' / 'season_stats.csv'))
+    write_name_store(str(tmp_path / 'data' / 'college_players.db'),
+                     {'Ann Baker': '/ann-baker-1.html'})
+    player_predictor.save_player_data(pd.DataFrame([{
+        'name': 'Ann Baker', 'nba_career_length': 2, 'best_year': 1,
+        'Points': 10.0, 'Assists': 2.0, 'Rebounds': 5.0, 'FGP': 0.5}]))
+    with open(tmp_path / 'data' / 'refresh_state.json', 'w') as outfile:
+        json.dump({'closed_seasons': list(range(1950, 2027)),
+                   'college_checked': ['Ann Baker']}, outfile)
+
+    calls = []
+
+    def fetch_nba_career_data(players, first_year, last_year):
+        calls.append((players, first_year, last_year))
+        return season_table([('Ann Baker', year)
+                             for year in range(first_year, last_year + 1)
+                             if players is None or 'Ann Baker' in players])
+
+    monkeypatch.setattr(manual_utils, 'fetch_nba_career_data',
+                        fetch_nba_career_data)
+    monkeypatch.setattr(manual_utils, 'fetch_nba_player_URLs',
+                        lambda: {'Ann Baker': 'bakeran01.html'})
+    monkeypatch.setattr(manual_utils, 'fetch_college_data',
+                        lambda players_cbb, players: {})
+    return calls
+
+
+def test_offseason_with_every_season_closed(refreshed):
+    """
+    In August, the season that just ended is closed like all the others,
+    and the refresh rescrapes it instead of failing.
+    """
+    player_predictor.init_data_incremental(today=date(2026, 8, 15))
+
+    assert [(first, last) for players, first, last in refreshed] == \
+        [(2026, 2026)]
+
+
+def test_seasons_filtered_by_player_index(refreshed):
+    """
+    Season rows are kept for the players in the nba player index, like in
+    a full refresh.
+    """
+    player_predictor.init_data_incremental(today=date(2026, 11, 1))
+
+    assert [(set(players), first, last)
+            for players, first, last in refreshed] == \
+        [({'Ann Baker'}, 2027, 2027)]
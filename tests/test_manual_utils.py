@@ -0,0 +1,19 @@
+"""
+Tests for the name helpers in 'manual_utils.py'.
+"""
+
+import pytest
+from manual_utils import index_letter
+
+
+@pytest.mark.parametrize('name, letter', [
+    ('LeBron James', 'j'),
+    ('Jabari Smith Jr.', 's'),
+    ('Kevin Porter III', 'p'),
+    ('Gary Payton II', 'p'),
+    ('Claudell Harris Jr.', 'h'),
+    ('Nene', 'n'),
+    ('', None),
+])
+def test_index_letter(name, letter):
+    assert index_letter(name) == letter
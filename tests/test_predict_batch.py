@@ -0,0 +1,56 @@
+"""
+Tests for predict_batch in 'player_predictor.py', with the page fetcher
+stubbed out.
+"""
+
+import numpy as np
+import pytest
+import requests
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+import manual_utils
+import scrape_utils
+from player_predictor import FEATURES, predict_batch
+
+PAGE = b'\n'.join(
+    b'<div><span data-tip="x"><strong>' + header + b'</strong></span>\n'
+    b'<p>12.5</p></div>' for header in manual_utils.COLLEGE_STAT_FIELDS)
+
+
+@pytest.fixture
+def models():
+    """
+    Returns a small careerstats regressor and allstar classifier.
+    """
+    rng = np.random.default_rng(0)
+    features = rng.uniform(0, 30, (50, len(FEATURES))).astype(np.float32)
+    career = RandomForestRegressor(n_estimators=5, random_state=0)\
+        .fit(features, rng.integers(1, 15, (50, 2)).astype(float))
+    allstar = RandomForestClassifier(n_estimators=5, random_state=0)\
+        .fit(features, rng.random(50) < 0.3)
+    return career, allstar
+
+
+def test_failed_fetch_is_a_row_error(models, monkeypatch):
+    """
+    A page that fails after its retries gives its prospect an error, and
+    the rest of the batch is still predicted.
+    """
+    def fetch_page(url):
+        if url.endswith('/bad-1.html'):
+            raise requests.HTTPError('503 Server Error: ' + url)
+        return PAGE
+
+    monkeypatch.setattr(scrape_utils, 'fetch_page', fetch_page)
+    monkeypatch.setattr(manual_utils, '_college_store', None)
+    cbb_players = {'Good Player': '/good-1.html',
+                   'Bad Player': '/bad-1.html'}
+
+    results = list(predict_batch([{'name': 'Good Player'},
+                                  {'name': 'Bad Player'}],
+                                 cbb_players, *models))
+
+    assert 'error' not in results[0]
+    assert results[0]['Points'] == '12.5'
+    assert 'projected_career_length' in results[0]
+    assert results[1]['error'].startswith('could not fetch college stats')
+    assert 'projected_career_length' not in results[1]
@@ -0,0 +1,70 @@
+"""
+Tests for retries in 'scrape_utils.py', run against a local server that
+cuts its first responses short.
+"""
+
+import socket
+import threading
+import pytest
+import requests
+import scrape_utils
+
+BODY = b'<html>season totals</html>'
+
+
+@pytest.fixture
+def flaky_server():
+    """
+    Serves BODY, but the first two responses promise more bytes than they
+    send and close the connection. Returns the server's URL and a list of
+    the requests it answered.
+    """
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen()
+    answered = []
+
+    def serve():
+        while True:
+            try:
+                conn, address = listener.accept()
+            except OSError:
+                return
+            with conn:
+                conn.recv(65536)
+                answered.append(address)
+                length = len(BODY) + (100 if len(answered) <= 2 else 0)
+                conn.sendall(b'HTTP/1.1 200 OK\r\nConnection: close\r\n'
+                             b'Content-Length: ' + str(length).encode() +
+                             b'\r\n\r\n' + BODY)
+
+    threading.Thread(target=serve, daemon=True).start()
+    limits = scrape_utils.HOST_RATE, scrape_utils.BACKOFF
+    scrape_utils.configure(host_rate=0, backoff=0.01)
+    yield 'http://127.0.0.1:' + str(listener.getsockname()[1]) + '/', \
+        answered
+    listener.close()
+    scrape_utils.configure(host_rate=limits[0], backoff=limits[1])
+
+
+def test_truncated_responses_are_retried(flaky_server):
+    url, answered = flaky_server
+    assert scrape_utils.fetch_page(url) == BODY
+    assert len(answered) == 3
+
+
+def test_truncated_responses_raise_after_retries(flaky_server):
+    url, answered = flaky_server
+    retries = scrape_utils.RETRIES
+    scrape_utils.configure(retries=1)
+    try:
+        with pytest.raises(requests.exceptions.ChunkedEncodingError):
+            scrape_utils.fetch_page(url)
+    finally:
+        scrape_utils.configure(retries=retries)
+    assert len(answered) == 2
+
+
+def test_invalid_urls_are_not_retried():
+    with pytest.raises(requests.exceptions.InvalidURL):
+        scrape_utils.fetch_page('http://')